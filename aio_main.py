@@ -0,0 +1,43 @@
+"""
+asyncio variant of the application on aiohttp and asyncpg
+
+run:
+    python aio_main.py
+    gunicorn -c gunicorn.conf.py --worker-class aiohttp.GunicornWebWorker "aio_main:create_app()"
+"""
+import os
+
+import asyncpg
+from aiohttp import web
+
+from app import models
+from app.aio.handlers import Handlers
+from app.services import cache, pool, strategies
+from app.services.data_validator import Validator
+
+
+async def open_pool(app: web.Application) -> None:
+    app['pool'] = await asyncpg.create_pool(models.get_db_url(), **pool.get_async_pool_options())
+
+
+async def close_pool(app: web.Application) -> None:
+    await app['pool'].close()
+
+
+def create_app() -> web.Application:
+    """
+    create and configure the application
+    :return: application
+    """
+    app = web.Application()
+    handlers = Handlers(Validator(), strategies.get_strategy(os.environ.get('ASSIGN_STRATEGY', 'greedy')),
+                        cache.get_cache())
+    handlers.add_routes(app)
+    app.on_startup.append(open_pool)
+    app.on_cleanup.append(close_pool)
+
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host="0.0.0.0", port=8080)
@@ -0,0 +1,53 @@
+"""compiled schedules
+
+Revision ID: 9f1c2b7d3e50
+Revises: 584d317140a4
+Create Date: 2026-10-18 09:12:40.512318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f1c2b7d3e50'
+down_revision = '584d317140a4'
+branch_labels = None
+depends_on = None
+
+
+def _compile(ranges_str):
+    intervals = []
+    for range_str in ranges_str or []:
+        start, finish = range_str.split('-')
+        intervals.append((int(start[:-3]) * 60 + int(start[-2:]), int(finish[:-3]) * 60 + int(finish[-2:])))
+    return [minute for interval in sorted(intervals) for minute in interval]
+
+
+def _backfill(table_name, hours_column, intervals_column):
+    table = sa.table(
+        table_name,
+        sa.column('id', sa.Integer()),
+        sa.column(hours_column, sa.ARRAY(sa.String(length=30))),
+        sa.column(intervals_column, sa.ARRAY(sa.Integer()))
+    )
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([table.c.id, table.c[hours_column]])).fetchall()
+    for row_id, hours in rows:
+        connection.execute(
+            table.update()
+            .where(table.c.id == row_id)
+            .values({intervals_column: _compile(hours)})
+        )
+
+
+def upgrade():
+    op.add_column('couriers', sa.Column('working_intervals', sa.ARRAY(sa.Integer()), nullable=True))
+    op.add_column('orders', sa.Column('delivery_intervals', sa.ARRAY(sa.Integer()), nullable=True))
+    _backfill('couriers', 'working_hours', 'working_intervals')
+    _backfill('orders', 'delivery_hours', 'delivery_intervals')
+
+
+def downgrade():
+    op.drop_column('orders', 'delivery_intervals')
+    op.drop_column('couriers', 'working_intervals')
@@ -0,0 +1,32 @@
+"""planned courier of orders
+
+Revision ID: a8d4c6e2f719
+Revises: e5b2f8a41c93
+Create Date: 2026-10-18 15:41:09.271845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d4c6e2f719'
+down_revision = 'e5b2f8a41c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('orders', sa.Column('planned_courier_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('orders_planned_courier_id_fkey', 'orders', 'couriers', ['planned_courier_id'], ['id'])
+    with op.get_context().autocommit_block():
+        op.create_index('ix_orders_unassigned_planned_courier', 'orders', ['planned_courier_id'], unique=False,
+                        postgresql_where=sa.text('courier_id IS NULL AND start_date IS NULL AND finish_date IS NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_orders_unassigned_planned_courier', table_name='orders', postgresql_concurrently=True)
+    op.drop_constraint('orders_planned_courier_id_fkey', 'orders', type_='foreignkey')
+    op.drop_column('orders', 'planned_courier_id')
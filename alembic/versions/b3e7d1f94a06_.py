@@ -0,0 +1,57 @@
+"""courier, counters and last finish of deliveries
+
+Revision ID: b3e7d1f94a06
+Revises: a8d4c6e2f719
+Create Date: 2026-10-18 19:12:37.508113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e7d1f94a06'
+down_revision = 'a8d4c6e2f719'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('deliveries', sa.Column('courier_id', sa.Integer(), nullable=True))
+    op.add_column('deliveries', sa.Column('last_finish_at', sa.DateTime(), nullable=True))
+    op.add_column('deliveries', sa.Column('completed_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('deliveries', sa.Column('remaining_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('deliveries', sa.Column('closed_at', sa.DateTime(), nullable=True))
+    op.create_foreign_key('deliveries_courier_id_fkey', 'deliveries', 'couriers', ['courier_id'], ['id'])
+    op.execute("""UPDATE deliveries
+SET courier_id = delivery_orders.courier_id,
+    last_finish_at = delivery_orders.last_finish_at,
+    completed_count = delivery_orders.completed_count,
+    remaining_count = delivery_orders.remaining_count
+FROM (
+    SELECT delivery_id,
+           max(courier_id) AS courier_id,
+           max(finish_date) AS last_finish_at,
+           count(finish_date) AS completed_count,
+           count(*) - count(finish_date) AS remaining_count
+    FROM orders
+    WHERE delivery_id IS NOT NULL
+    GROUP BY delivery_id
+) AS delivery_orders
+WHERE deliveries.id = delivery_orders.delivery_id""")
+    op.execute('UPDATE deliveries SET closed_at = COALESCE(last_finish_at, LOCALTIMESTAMP) WHERE remaining_count = 0')
+    # the previous finish of a delivery is read from last_finish_at instead of orders
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_orders_courier_delivery_finish', table_name='orders', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_orders_courier_delivery_finish', 'orders', ['courier_id', 'delivery_id', 'finish_date'],
+                        unique=False, postgresql_concurrently=True)
+    op.drop_constraint('deliveries_courier_id_fkey', 'deliveries', type_='foreignkey')
+    op.drop_column('deliveries', 'closed_at')
+    op.drop_column('deliveries', 'remaining_count')
+    op.drop_column('deliveries', 'completed_count')
+    op.drop_column('deliveries', 'last_finish_at')
+    op.drop_column('deliveries', 'courier_id')
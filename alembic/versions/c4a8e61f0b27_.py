@@ -0,0 +1,37 @@
+"""courier region stats
+
+Revision ID: c4a8e61f0b27
+Revises: 9f1c2b7d3e50
+Create Date: 2026-10-18 10:03:11.874025
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a8e61f0b27'
+down_revision = '9f1c2b7d3e50'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('courier_region_stats',
+    sa.Column('courier_id', sa.Integer(), nullable=False),
+    sa.Column('region', sa.Integer(), nullable=False),
+    sa.Column('delivery_time_sum', sa.Float(), nullable=False),
+    sa.Column('delivery_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['courier_id'], ['couriers.id'], ),
+    sa.PrimaryKeyConstraint('courier_id', 'region')
+    )
+    op.execute(
+        'INSERT INTO courier_region_stats (courier_id, region, delivery_time_sum, delivery_count) '
+        'SELECT courier_id, region, sum(delivery_time), count(delivery_time) FROM orders '
+        'WHERE courier_id IS NOT NULL AND delivery_time IS NOT NULL '
+        'GROUP BY courier_id, region'
+    )
+
+
+def downgrade():
+    op.drop_table('courier_region_stats')
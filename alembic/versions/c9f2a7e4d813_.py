@@ -0,0 +1,105 @@
+"""partitioning of orders by completed period
+
+The table of orders becomes the partition orders_active of the partitioned table, so rows are not copied:
+its indexes are renamed and attached to the same indexes of the partitioned table, foreign keys are merged.
+Scans of the table are done before it is locked exclusively: the check of the partition bound is validated
+and the new indexes are built concurrently, so attaching the partition uses them instead of scanning.
+
+The primary key is (id, completed_period), so the database keeps ids unique only within a period:
+ids of active orders are unique by orders_active_id_key, archived orders are in partitions by month created
+by the archival job, and a new order with the id of an archived one is only rejected by the validation
+of the application.
+
+Revision ID: c9f2a7e4d813
+Revises: b3e7d1f94a06
+Create Date: 2026-10-18 21:03:52.614390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9f2a7e4d813'
+down_revision = 'b3e7d1f94a06'
+branch_labels = None
+depends_on = None
+
+UNASSIGNED = 'courier_id IS NULL AND start_date IS NULL AND finish_date IS NULL'
+ACTIVE_FINISHED = 'completed_period = 0 AND finish_date IS NOT NULL'
+INDEXES = (
+    ('ix_orders_unassigned_region_weight', ['region', 'weight'], {'postgresql_where': sa.text(UNASSIGNED)}),
+    ('ix_orders_courier_in_flight', ['courier_id'],
+     {'postgresql_where': sa.text('start_date IS NOT NULL AND finish_date IS NULL')}),
+    ('ix_orders_unassigned_delivery_span', ['delivery_span'],
+     {'postgresql_where': sa.text(UNASSIGNED), 'postgresql_using': 'gist'}),
+    ('ix_orders_unassigned_planned_courier', ['planned_courier_id'], {'postgresql_where': sa.text(UNASSIGNED)}),
+)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        # the default of the new column is not written to rows
+        op.add_column('orders', sa.Column('completed_period', sa.Integer(), nullable=False, server_default='0'))
+        op.execute('ALTER TABLE orders ADD CONSTRAINT orders_active_period_check '
+                   'CHECK (completed_period >= 0 AND completed_period < 1) NOT VALID')
+        op.execute('ALTER TABLE orders VALIDATE CONSTRAINT orders_active_period_check')
+        op.create_index('orders_active_id_key', 'orders', ['id'], unique=True, postgresql_concurrently=True)
+        op.create_index('orders_active_pkey', 'orders', ['id', 'completed_period'], unique=True,
+                        postgresql_concurrently=True)
+        op.create_index('ix_orders_active_finish_active', 'orders', ['finish_date'], unique=False,
+                        postgresql_where=sa.text(ACTIVE_FINISHED), postgresql_concurrently=True)
+
+    op.rename_table('orders', 'orders_active')
+    op.drop_constraint('orders_pkey', 'orders_active', type_='primary')
+    # the primary key of the partitioned table takes only the index of a primary key of the partition
+    op.execute('ALTER TABLE orders_active ADD CONSTRAINT orders_active_pkey PRIMARY KEY USING INDEX orders_active_pkey')
+    for name, _, _ in INDEXES:
+        op.execute(f'ALTER INDEX {name} RENAME TO {name}_active')
+
+    op.create_table(
+        'orders',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('orders_id_seq'::regclass)"),
+                  nullable=False),
+        sa.Column('weight', sa.Float(), nullable=True),
+        sa.Column('region', sa.Integer(), nullable=True),
+        sa.Column('delivery_hours', sa.ARRAY(sa.String(length=30)), nullable=True),
+        sa.Column('courier_id', sa.Integer(), nullable=True),
+        sa.Column('start_date', sa.DateTime(), nullable=True),
+        sa.Column('finish_date', sa.DateTime(), nullable=True),
+        sa.Column('delivery_time', sa.Float(), nullable=True),
+        sa.Column('delivery_id', sa.Integer(), nullable=True),
+        sa.Column('delivery_intervals', sa.ARRAY(sa.Integer()), nullable=True),
+        sa.Column('delivery_ranges', sa.ARRAY(postgresql.INT4RANGE()),
+                  sa.Computed('intervals_to_ranges(delivery_intervals)'), nullable=True),
+        sa.Column('delivery_span', postgresql.INT4RANGE(), sa.Computed('intervals_span(delivery_intervals)'),
+                  nullable=True),
+        sa.Column('planned_courier_id', sa.Integer(), nullable=True),
+        sa.Column('completed_period', sa.Integer(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['courier_id'], ['couriers.id'], name='orders_courier_id_fkey'),
+        sa.ForeignKeyConstraint(['delivery_id'], ['deliveries.id'], name='orders_delivery_id_fkey'),
+        sa.ForeignKeyConstraint(['planned_courier_id'], ['couriers.id'], name='orders_planned_courier_id_fkey'),
+        sa.PrimaryKeyConstraint('id', 'completed_period', name='orders_pkey'),
+        postgresql_partition_by='RANGE (completed_period)'
+    )
+    # the bound is implied by the validated check, so the partition is not scanned
+    op.execute('ALTER TABLE orders ATTACH PARTITION orders_active FOR VALUES FROM (0) TO (1)')
+    # indexes of the partitioned table take the indexes of the partition instead of building them
+    for name, columns, options in INDEXES:
+        op.create_index(name, 'orders', columns, unique=False, **options)
+    op.create_index('ix_orders_active_finish', 'orders', ['finish_date'], unique=False,
+                    postgresql_where=sa.text(ACTIVE_FINISHED))
+    op.drop_constraint('orders_active_period_check', 'orders_active', type_='check')
+
+
+def downgrade():
+    op.execute('UPDATE orders SET completed_period = 0 WHERE completed_period > 0')
+    op.execute('ALTER TABLE orders DETACH PARTITION orders_active')
+    op.drop_table('orders')
+    # the primary key and ix_orders_active_finish are dropped with the column
+    op.drop_column('orders_active', 'completed_period')
+    op.execute('ALTER TABLE orders_active ADD CONSTRAINT orders_pkey PRIMARY KEY USING INDEX orders_active_id_key')
+    for name, _, _ in INDEXES:
+        op.execute(f'ALTER INDEX {name}_active RENAME TO {name}')
+    op.rename_table('orders_active', 'orders')
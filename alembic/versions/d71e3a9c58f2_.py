@@ -0,0 +1,36 @@
+"""orders hot query indexes
+
+Revision ID: d71e3a9c58f2
+Revises: c4a8e61f0b27
+Create Date: 2026-10-18 11:26:52.309417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd71e3a9c58f2'
+down_revision = 'c4a8e61f0b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # indexes are built concurrently, so orders stay writable while migrating a big table
+    with op.get_context().autocommit_block():
+        op.create_index('ix_orders_unassigned_region_weight', 'orders', ['region', 'weight'], unique=False,
+                        postgresql_where=sa.text('courier_id IS NULL AND start_date IS NULL AND finish_date IS NULL'),
+                        postgresql_concurrently=True)
+        op.create_index('ix_orders_courier_in_flight', 'orders', ['courier_id'], unique=False,
+                        postgresql_where=sa.text('start_date IS NOT NULL AND finish_date IS NULL'),
+                        postgresql_concurrently=True)
+        op.create_index('ix_orders_courier_delivery_finish', 'orders', ['courier_id', 'delivery_id', 'finish_date'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_orders_courier_delivery_finish', table_name='orders', postgresql_concurrently=True)
+        op.drop_index('ix_orders_courier_in_flight', table_name='orders', postgresql_concurrently=True)
+        op.drop_index('ix_orders_unassigned_region_weight', table_name='orders', postgresql_concurrently=True)
@@ -0,0 +1,60 @@
+"""time ranges
+
+Revision ID: e5b2f8a41c93
+Revises: d71e3a9c58f2
+Create Date: 2026-10-18 13:02:37.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2f8a41c93'
+down_revision = 'd71e3a9c58f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # closed ranges of minutes from compiled intervals, inverted intervals like '22:00-02:00' have no range
+    op.execute("""
+        CREATE FUNCTION intervals_to_ranges(intervals integer[]) RETURNS int4range[]
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT coalesce(array_agg(int4range(intervals[i], intervals[i + 1], '[]') ORDER BY i), '{}')
+            FROM generate_series(1, cardinality(intervals), 2) AS i
+            WHERE intervals[i] <= intervals[i + 1]
+        $$
+    """)
+    op.execute("""
+        CREATE FUNCTION intervals_span(intervals integer[]) RETURNS int4range
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT CASE WHEN count(*) = 0 THEN 'empty'::int4range
+                        ELSE int4range(min(intervals[i]), max(intervals[i + 1]), '[]') END
+            FROM generate_series(1, cardinality(intervals), 2) AS i
+            WHERE intervals[i] <= intervals[i + 1]
+        $$
+    """)
+    # generated columns are filled for existing rows and recomputed on every write of intervals
+    op.add_column('couriers', sa.Column('working_ranges', postgresql.ARRAY(postgresql.INT4RANGE()),
+                                        sa.Computed('intervals_to_ranges(working_intervals)', persisted=True)))
+    op.add_column('orders', sa.Column('delivery_ranges', postgresql.ARRAY(postgresql.INT4RANGE()),
+                                      sa.Computed('intervals_to_ranges(delivery_intervals)', persisted=True)))
+    op.add_column('orders', sa.Column('delivery_span', postgresql.INT4RANGE(),
+                                      sa.Computed('intervals_span(delivery_intervals)', persisted=True)))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_orders_unassigned_delivery_span', 'orders', ['delivery_span'], unique=False,
+                        postgresql_using='gist',
+                        postgresql_where=sa.text('courier_id IS NULL AND start_date IS NULL AND finish_date IS NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_orders_unassigned_delivery_span', table_name='orders', postgresql_concurrently=True)
+    op.drop_column('orders', 'delivery_span')
+    op.drop_column('orders', 'delivery_ranges')
+    op.drop_column('couriers', 'working_ranges')
+    op.execute('DROP FUNCTION intervals_span(integer[])')
+    op.execute('DROP FUNCTION intervals_to_ranges(integer[])')
@@ -0,0 +1,76 @@
+"""split time windows which cross midnight
+
+Windows like '22:00-02:00' are split into [1320, 1439] and [0, 120] like by util.split_intervals
+instead of having no range, stored inverted intervals are split too, so their ranges are recomputed.
+
+Revision ID: f4d8a2c6e915
+Revises: c9f2a7e4d813
+Create Date: 2026-10-18 23:41:06.283915
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4d8a2c6e915'
+down_revision = 'c9f2a7e4d813'
+branch_labels = None
+depends_on = None
+
+HAS_INVERTED = """EXISTS (
+    SELECT 1 FROM generate_series(1, cardinality({column}), 2) AS i WHERE {column}[i] > {column}[i + 1]
+)"""
+
+# generated columns are recomputed when intervals are updated
+SPLIT_SQL = """UPDATE {table}
+SET {column} = (
+    SELECT coalesce(array_agg(minute ORDER BY window_range, position), '{{}}')
+    FROM unnest(intervals_to_ranges({column})) AS window_range,
+         unnest(ARRAY[lower(window_range), upper(window_range) - 1]) WITH ORDINALITY AS minutes(minute, position)
+)
+WHERE """ + HAS_INVERTED
+
+
+def upgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION intervals_to_ranges(intervals integer[]) RETURNS int4range[]
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT coalesce(array_agg(window_range ORDER BY window_range), '{}')
+            FROM generate_series(1, cardinality(intervals), 2) AS i,
+                 unnest(CASE WHEN intervals[i] <= intervals[i + 1]
+                             THEN ARRAY[int4range(intervals[i], intervals[i + 1], '[]')]
+                             ELSE ARRAY[int4range(intervals[i], 1439, '[]'), int4range(0, intervals[i + 1], '[]')]
+                        END) AS window_range
+        $$
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION intervals_span(intervals integer[]) RETURNS int4range
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT CASE WHEN count(*) = 0 THEN 'empty'::int4range
+                        ELSE int4range(min(lower(window_range)), max(upper(window_range))) END
+            FROM unnest(intervals_to_ranges(intervals)) AS window_range
+        $$
+    """)
+    op.execute(SPLIT_SQL.format(table='couriers', column='working_intervals'))
+    op.execute(SPLIT_SQL.format(table='orders', column='delivery_intervals'))
+
+
+def downgrade():
+    # split intervals are kept, they have the same ranges with the previous functions
+    op.execute("""
+        CREATE OR REPLACE FUNCTION intervals_to_ranges(intervals integer[]) RETURNS int4range[]
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT coalesce(array_agg(int4range(intervals[i], intervals[i + 1], '[]') ORDER BY i), '{}')
+            FROM generate_series(1, cardinality(intervals), 2) AS i
+            WHERE intervals[i] <= intervals[i + 1]
+        $$
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION intervals_span(intervals integer[]) RETURNS int4range
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT CASE WHEN count(*) = 0 THEN 'empty'::int4range
+                        ELSE int4range(min(intervals[i]), max(intervals[i + 1]), '[]') END
+            FROM generate_series(1, cardinality(intervals), 2) AS i
+            WHERE intervals[i] <= intervals[i + 1]
+        $$
+    """)
@@ -0,0 +1,463 @@
+"""
+asyncio variant of resources of couriers and orders, the same urls, json-bodies and status codes,
+validation and business logic are shared with the flask application
+"""
+import contextlib
+import datetime
+import json
+
+from aiohttp import web
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from app.aio import queries
+from app.services import completion, pool, serializer, util
+from app.services.bulk import BULK_INSERT_BATCH_SIZE
+from app.services.cache import CacheBackend, courier_key
+from app.services.data_validator import Validator, get_error_body
+from app.services.matcher import ASSIGN_CLAIM_ATTEMPTS, OrderBatch, OrderClaim
+from app.services.streaming import NDJSON_MIMETYPE
+from app.services.util import Object
+
+
+class Rollback(Exception):
+    """
+    Rollback exception interrupts the transaction and is answered by its response
+    :arg
+        response : web.Response
+    """
+
+    def __init__(self, response: web.Response) -> None:
+        super().__init__()
+        self.response = response
+
+
+def json_response(data, status: int) -> web.Response:
+    """
+    encode json-body in the same format as flask-restful
+    """
+    return web.Response(text=serializer.dump(data), status=status, content_type='application/json')
+
+
+def id_list_response(entity_name: str, entity_ids: [int], status: int) -> web.Response:
+    return web.Response(text=serializer.dump_id_list(entity_name, entity_ids), status=status,
+                        content_type='application/json')
+
+
+def empty_response(status: int) -> web.Response:
+    return web.Response(status=status)
+
+
+def to_object(record) -> Object:
+    """
+    :param record: asyncpg record
+    :return: object with attributes by columns, so util functions can use it as a model
+    """
+    obj = Object()
+    for key, value in record.items():
+        setattr(obj, key, value)
+    return obj
+
+
+@contextlib.asynccontextmanager
+async def transaction(connection):
+    """
+    transaction which sets statement timeout in PgBouncer mode, as configure_engine does for the engine
+    """
+    async with connection.transaction():
+        statement_timeout = pool.get_statement_timeout()
+        if statement_timeout and pool.is_pgbouncer_mode():
+            await connection.execute(f'SET LOCAL statement_timeout = {statement_timeout}')
+        yield
+
+
+def accepts_ndjson(request: web.Request) -> bool:
+    """
+    the same choice by Accept header as request.accept_mimetypes.best_match of flask
+    """
+    accept = parse_accept_header(request.headers.get('Accept'), MIMEAccept)
+    return accept.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+async def read_json(request: web.Request):
+    """
+    :return: json-body of request
+    :raises
+        Rollback with status 400 if body is not json
+    """
+    try:
+        return json.loads(await request.read())
+    except ValueError:
+        raise Rollback(empty_response(400))
+
+
+async def iter_ndjson_chunks(stream, size: int):
+    """
+    parse newline-delimited json of the request stream by chunks
+    :param stream: StreamReader of the request body
+    :param size: max count of entities in chunk
+    :raises
+        ValueError if some line is not json
+    """
+    chunk = []
+    async for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        chunk.append(json.loads(line))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Handlers:
+    """
+    Handlers class holds handlers of all urls
+    :arg
+        validator : Validator
+            validate the json-body
+        strategy : function
+            choose orders which fit into free capacity of courier
+        cache : CacheBackend
+            cache of couriers with statistic, the backend should not block, as the in-process one
+    """
+
+    def __init__(self, validator: Validator, strategy, cache: CacheBackend) -> None:
+        self.validator = validator
+        self.strategy = strategy
+        self.cache = cache
+
+    def add_routes(self, app: web.Application) -> None:
+        app.add_routes([
+            web.post('/couriers', self.post_couriers),
+            web.get('/couriers', self.get_couriers),
+            web.get(r'/couriers/{courier_id:\d+}', self.get_courier),
+            web.patch(r'/couriers/{courier_id:\d+}', self.patch_courier),
+            web.post('/orders', self.post_orders),
+            web.post('/orders/assign', self.assign_orders),
+            web.post('/orders/complete', self.complete_order),
+            web.post('/orders/complete/batch', self.complete_orders),
+        ])
+
+    async def validate_entities(self, connection, entity_name: str, entities: list, seen_entity_ids: set = None):
+        """
+        the same validation as Validator.validate_*_entities with asyncpg connection
+        :return: list of error ids, or None if some entity has no id
+        """
+        checked = self.validator.check_entities(entity_name, entities)
+        if checked is None:
+            return None
+        invalid_indexes, entity_ids = checked
+        exists_entity_ids = await queries.get_exists_ids(connection, entity_name, entity_ids)
+
+        return self.validator.get_error_ids(entity_name, entities, invalid_indexes, exists_entity_ids,
+                                            seen_entity_ids)
+
+    async def post_couriers(self, request: web.Request):
+        return await self.post_entities(request, 'couriers', util.get_courier_row)
+
+    async def post_orders(self, request: web.Request):
+        return await self.post_entities(request, 'orders', util.get_order_row)
+
+    async def post_entities(self, request: web.Request, entity_name: str, get_row):
+        """
+        create couriers or orders by json of the request body, or by ndjson-body
+        :returns response with ids of new entities and status 201
+        :raises
+            return response with status 400 if json-body is not validated
+        """
+        try:
+            async with request.app['pool'].acquire() as connection:
+                async with transaction(connection):
+                    if request.content_type == NDJSON_MIMETYPE:
+                        entity_ids = await self.import_ndjson(connection, request.content, entity_name, get_row)
+                    else:
+                        entity_ids = await self.import_json(connection, await read_json(request), entity_name,
+                                                            get_row)
+        except Rollback as e:
+            return e.response
+
+        return id_list_response(entity_name, entity_ids, 201)
+
+    async def import_json(self, connection, json_data, entity_name: str, get_row) -> [int]:
+        if not self.validator.data_validator.is_valid(json_data):
+            raise Rollback(empty_response(400))
+        error_entity_ids = await self.validate_entities(connection, entity_name, json_data['data'])
+        if error_entity_ids is None:
+            raise Rollback(empty_response(400))
+        if error_entity_ids:
+            raise Rollback(json_response(get_error_body(entity_name, error_entity_ids), 400))
+
+        rows = [get_row(entity) for entity in json_data['data']]
+        for i in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+            await queries.insert_rows(connection, entity_name, rows[i:i + BULK_INSERT_BATCH_SIZE])
+        return [row['id'] for row in rows]
+
+    async def import_ndjson(self, connection, stream, entity_name: str, get_row) -> [int]:
+        """
+        the same import as streaming.import_ndjson, inserted chunks are rolled back on error
+        """
+        entity_ids = []
+        error_entity_ids = []
+        seen_entity_ids = set()
+        try:
+            async for chunk in iter_ndjson_chunks(stream, BULK_INSERT_BATCH_SIZE):
+                if not error_entity_ids:
+                    seen_entity_ids = set()
+                chunk_error_ids = await self.validate_entities(connection, entity_name, chunk, seen_entity_ids)
+                if chunk_error_ids is None:
+                    raise Rollback(empty_response(400))
+                error_entity_ids.extend(chunk_error_ids)
+                if error_entity_ids:
+                    continue
+                rows = [get_row(entity) for entity in chunk]
+                await queries.insert_rows(connection, entity_name, rows)
+                entity_ids.extend(row['id'] for row in rows)
+        except ValueError:
+            raise Rollback(empty_response(400))
+
+        if error_entity_ids:
+            raise Rollback(json_response(get_error_body(entity_name, error_entity_ids), 400))
+        return entity_ids
+
+    async def get_courier(self, request: web.Request):
+        """
+        return courier with statistic by courier_id
+        :returns response with courier by id and status 200
+        :raises
+            return response with status 400 if courier is not exists
+        """
+        courier_id = int(request.match_info['courier_id'])
+        key = courier_key(courier_id)
+        token = self.cache.begin(key)
+        result = self.cache.get(key)
+        if result is not None:
+            return json_response(result, 200)
+
+        async with request.app['pool'].acquire() as connection:
+            async with transaction(connection):
+                record = await queries.get_courier(connection, courier_id)
+                if not record:
+                    return empty_response(400)
+                stats = await queries.get_courier_stats(connection, courier_id)
+
+        courier = to_object(record)
+        courier.rating = util.calculate_courier_rating(stats)
+        courier.earnings = util.get_earnings(courier)
+        result = serializer.courier_statistic_to_dict(courier)
+        self.cache.set(key, result, token)
+        return json_response(result, 200)
+
+    async def get_couriers(self, request: web.Request):
+        """
+        the same list of couriers as Couriers.get_list
+        :returns response with couriers and status 200, not existing ids are skipped
+        :raises
+            return response with status 400 if arguments are not validated
+        """
+        try:
+            courier_ids = [int(courier_id) for courier_id in request.query['ids'].split(',')] \
+                if 'ids' in request.query else None
+            after_id = int(request.query.get('after_id', 0))
+            limit = int(request.query.get('limit', util.COURIERS_PAGE_SIZE))
+        except ValueError:
+            return empty_response(400)
+        if not 0 < limit <= util.COURIERS_PAGE_MAX \
+                or courier_ids is not None and not 0 < len(courier_ids) <= util.COURIERS_PAGE_MAX:
+            return empty_response(400)
+
+        async with request.app['pool'].acquire() as connection:
+            if accepts_ndjson(request):
+                response = web.StreamResponse(status=200)
+                response.content_type = NDJSON_MIMETYPE
+                await response.prepare(request)
+                async for page in self.iter_couriers_pages(connection, courier_ids, after_id):
+                    await response.write(''.join(serializer.dump(courier) for courier in page).encode())
+                await response.write_eof()
+                return response
+
+            next_after_id = None
+            if courier_ids is not None:
+                couriers = await self.load_couriers(connection, courier_ids=courier_ids)
+            else:
+                couriers = await self.load_couriers(connection, after_id=after_id, limit=limit)
+                if len(couriers) == limit:
+                    next_after_id = couriers[-1]['courier_id']
+
+        return json_response({'couriers': couriers, 'next_after_id': next_after_id}, 200)
+
+    async def iter_couriers_pages(self, connection, courier_ids: [int], after_id: int):
+        if courier_ids is not None:
+            for i in range(0, len(courier_ids), util.COURIERS_PAGE_SIZE):
+                yield await self.load_couriers(connection, courier_ids=courier_ids[i:i + util.COURIERS_PAGE_SIZE])
+            return
+        page = await self.load_couriers(connection, after_id=after_id, limit=util.COURIERS_PAGE_MAX)
+        while page:
+            yield page
+            page = await self.load_couriers(connection, after_id=page[-1]['courier_id'], limit=util.COURIERS_PAGE_MAX)
+
+    async def load_couriers(self, connection, courier_ids: [int] = None, after_id: int = 0, limit: int = None):
+        """
+        :return: couriers with statistic by ids in the same order, or page after after_id
+        """
+        records = await queries.get_couriers(connection, courier_ids, after_id, limit)
+        min_times = await queries.get_couriers_min_times(connection, [record['id'] for record in records])
+        couriers = {}
+        for courier in map(to_object, records):
+            courier.rating = round(util.calculate_rating(min_times.get(courier.id, float('inf'))), 2)
+            courier.earnings = util.get_earnings(courier)
+            couriers[courier.id] = serializer.courier_statistic_to_dict(courier)
+        if courier_ids is None:
+            return list(couriers.values())
+        return [couriers[courier_id] for courier_id in courier_ids if courier_id in couriers]
+
+    async def patch_courier(self, request: web.Request):
+        """
+        return and update courier by courier_id
+        :returns: response with updated courier by id and status 200
+        :raises
+            return response with status 400 if courier is not exists or json-body is not validated
+        """
+        courier_id = int(request.match_info['courier_id'])
+        try:
+            json_data = await read_json(request)
+        except Rollback as e:
+            return e.response
+        if not self.validator.validate_path_courier(json_data):
+            return empty_response(400)
+
+        values = {key: json_data[key] for key in ('courier_type', 'regions', 'working_hours') if key in json_data}
+        if 'working_hours' in values:
+            values['working_intervals'] = util.compile_time_ranges(values['working_hours'])
+
+        async with request.app['pool'].acquire() as connection:
+            async with transaction(connection):
+                # the courier row lock serializes the update with assignments of the courier,
+                # UPDATE takes it and the courier is locked without changes if json-body has no fields
+                if values:
+                    record = await queries.update_courier(connection, courier_id, values)
+                else:
+                    record = await queries.get_courier(connection, courier_id, for_update=True)
+                if not record:
+                    return empty_response(400)
+                courier = to_object(record)
+
+                await queries.release_unfit_orders(connection, courier.id,
+                                                   util.get_weight_by_type(courier.courier_type),
+                                                   courier.regions,
+                                                   util.get_working_intervals(courier))
+
+        self.cache.delete(courier_key(courier.id))
+        return json_response(serializer.courier_to_dict(courier), 200)
+
+    async def assign_orders(self, request: web.Request):
+        """
+        assign order on courier
+        :return response with assigned orders on courier with status  200
+        :raises
+            return response with status 400 if json-body is not validated or courier with id not exists
+        """
+        try:
+            json_data = await read_json(request)
+        except Rollback as e:
+            return e.response
+        if not self.validator.validate_post_orders_assign(json_data):
+            return empty_response(400)
+
+        async with request.app['pool'].acquire() as connection:
+            async with transaction(connection):
+                record = await queries.get_courier_load(connection, json_data['courier_id'])
+                if not record:
+                    return empty_response(400)
+                courier = to_object(record)
+
+                weight = util.get_weight_by_type(courier.courier_type) - courier.assigned_weight
+                candidates = await queries.get_courier_candidates(connection, courier, weight)
+
+                batch = OrderBatch(candidates)
+                claim = OrderClaim(batch, list(range(len(batch))), weight, self.strategy, ASSIGN_CLAIM_ATTEMPTS)
+                delivery_id = None
+                chosen_ids = claim.choose()
+                while chosen_ids:
+                    claimed_ids, delivery_id = await queries.assign_orders(connection, courier.id, chosen_ids,
+                                                                           delivery_id)
+                    claim.claimed(claimed_ids)
+                    chosen_ids = claim.choose()
+
+        if claim.order_ids:
+            self.cache.delete(courier_key(courier.id))
+        order_ids = sorted((courier.assigned_ids or []) + claim.order_ids)
+        return id_list_response('orders', order_ids, 200)
+
+    async def complete_order(self, request: web.Request):
+        """
+        complete order
+        :return: response with id of completed order with status 200
+        :raises
+            return response with code 400 if json-body is not validated or courier or order is not found
+        """
+        try:
+            json_data = await read_json(request)
+        except Rollback as e:
+            return e.response
+        if not self.validator.validate_complete_order(json_data):
+            return empty_response(400)
+
+        async with request.app['pool'].acquire() as connection:
+            async with transaction(connection):
+                if not await queries.get_courier(connection, json_data['courier_id']):
+                    return empty_response(400)
+                order = await queries.get_started_order(connection, json_data['order_id'], json_data['courier_id'])
+                if not order:
+                    # archived orders are completed long ago
+                    order_id = await queries.get_archived_order_id(connection, json_data['order_id'],
+                                                                   json_data['courier_id'])
+                    if order_id is None:
+                        return empty_response(400)
+                    return json_response({'order_id': order_id}, 200)
+                completed = order['finish_date'] is None
+                if completed:
+                    finish_date = datetime.datetime.now()
+                    start_date = await queries.complete_delivery_order(connection, order['delivery_id'], finish_date)
+                    if start_date is None:
+                        start_date = order['start_date']
+                    delivery_time = (finish_date - start_date).total_seconds()
+                    await queries.complete_order(connection, order['id'], json_data['courier_id'], order['region'],
+                                                 finish_date, delivery_time)
+
+        if completed:
+            self.cache.delete(courier_key(json_data['courier_id']))
+        return json_response({'order_id': order['id']}, 200)
+
+    async def complete_orders(self, request: web.Request):
+        """
+        the same batch completion as CompleteOrders.post
+        :return: response with status of every item with status 200
+        :raises
+            return response with code 400 if json-body is not validated or some item has no order_id
+        """
+        try:
+            json_data = await read_json(request)
+        except Rollback as e:
+            return e.response
+        complete_times = self.validator.validate_complete_orders(json_data)
+        if complete_times is None:
+            return empty_response(400)
+        items = json_data['data']
+
+        order_ids = {item['order_id'] for item, complete_time in zip(items, complete_times) if complete_time}
+        async with request.app['pool'].acquire() as connection:
+            async with transaction(connection):
+                records = await queries.load_completed_orders(connection, sorted(order_ids))
+                orders = {record['id']: to_object(record) for record in records}
+                last_finishes = await queries.lock_deliveries(connection, orders)
+                statuses, completions = completion.plan_completions(items, complete_times, orders, last_finishes,
+                                                                    datetime.datetime.now())
+                await queries.save_completions(connection, completions)
+
+        for courier_id in {orders[order_id].courier_id for order_id, _, _ in completions}:
+            self.cache.delete(courier_key(courier_id))
+        return json_response({'orders': [{'id': item['order_id'], 'status': status}
+                                         for item, status in zip(items, statuses)]}, 200)
@@ -0,0 +1,275 @@
+"""
+queries of the asyncio API, every function takes asyncpg connection.
+Statements shared with app.services are converted from named parameters to positional ones of asyncpg
+"""
+import datetime
+import functools
+import re
+
+from app.services import assignment, completion, util
+
+# named parameter like :courier_id, casts like ::int and minutes like '10:30' are not parameters
+PARAMETER_REGEX = re.compile(r'(?<![:\w]):(\w+)')
+
+tables = {
+    'couriers': 'couriers',
+    'orders': 'orders'
+}
+
+
+@functools.lru_cache(maxsize=None)
+def to_positional(sql: str) -> (str, tuple):
+    """
+    :param sql: statement with named parameters of sqlalchemy.text
+    :return: statement with positional parameters and names of parameters by position
+    """
+    names = []
+
+    def replace(match) -> str:
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f'${names.index(name) + 1}'
+
+    return PARAMETER_REGEX.sub(replace, sql), tuple(names)
+
+
+def bind(sql: str, params: dict) -> list:
+    """
+    :param sql: statement with named parameters of sqlalchemy.text
+    :param params: values of parameters by names
+    :return: arguments of asyncpg fetch and execute
+    """
+    statement, names = to_positional(sql)
+    return [statement] + [params[name] for name in names]
+
+
+async def get_exists_ids(connection, entity_name: str, entity_ids: list) -> set:
+    """
+    :return: set of ids which already exist
+    """
+    if not entity_ids:
+        return set()
+    rows = await connection.fetch(f'SELECT id FROM {tables[entity_name]} WHERE id = ANY($1::int[])', entity_ids)
+    return {row['id'] for row in rows}
+
+
+async def insert_rows(connection, entity_name: str, rows: [dict]) -> None:
+    """
+    insert rows with COPY, all rows have the same keys
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+    await connection.copy_records_to_table(
+        tables[entity_name],
+        records=[tuple(row[column] for column in columns) for row in rows],
+        columns=columns
+    )
+
+
+async def get_courier(connection, courier_id: int, for_update: bool = False):
+    """
+    :param for_update: lock the courier row until the end of the transaction
+    :return: courier row or None
+    """
+    return await connection.fetchrow(
+        'SELECT id, courier_type, regions, working_hours, working_intervals, count_delivery '
+        'FROM couriers WHERE id = $1' + (' FOR UPDATE' if for_update else ''),
+        courier_id
+    )
+
+
+async def get_courier_stats(connection, courier_id: int) -> [tuple]:
+    """
+    :return: sum and count of delivery-times by regions
+    """
+    rows = await connection.fetch(
+        'SELECT delivery_time_sum, delivery_count FROM courier_region_stats WHERE courier_id = $1',
+        courier_id
+    )
+    return [(row['delivery_time_sum'], row['delivery_count']) for row in rows]
+
+
+async def get_couriers(connection, courier_ids: [int] = None, after_id: int = 0, limit: int = None):
+    """
+    :return: couriers by ids, or page of couriers after after_id by id
+    """
+    columns = 'SELECT id, courier_type, regions, working_hours, count_delivery FROM couriers '
+    if courier_ids is not None:
+        return await connection.fetch(columns + 'WHERE id = ANY($1::int[])', courier_ids)
+    return await connection.fetch(columns + 'WHERE id > $1 ORDER BY id LIMIT $2', after_id, limit)
+
+
+async def get_couriers_min_times(connection, courier_ids: [int]) -> dict:
+    """
+    the same query as util.set_couriers_statistic
+    :return: min average delivery-time by regions of couriers which have completed orders
+    """
+    rows = await connection.fetch(
+        'SELECT courier_id, min(delivery_time_sum / delivery_count) AS min_time FROM courier_region_stats '
+        'WHERE courier_id = ANY($1::int[]) AND delivery_count > 0 GROUP BY courier_id',
+        courier_ids
+    )
+    return {row['courier_id']: row['min_time'] for row in rows}
+
+
+async def update_courier(connection, courier_id: int, values: dict):
+    """
+    :param values: new values of couriers columns
+    :return: updated courier row
+    """
+    columns = list(values)
+    assignments = ', '.join(f'{column} = ${index + 2}' for index, column in enumerate(columns))
+    return await connection.fetchrow(
+        f'UPDATE couriers SET {assignments} WHERE id = $1 '
+        'RETURNING id, courier_type, regions, working_hours, working_intervals, count_delivery',
+        courier_id, *[values[column] for column in columns]
+    )
+
+
+async def release_unfit_orders(connection, courier_id: int, capacity: float, regions: [int],
+                               courier_intervals: [int]) -> None:
+    """
+    the same statement as assignment.release_unfit_orders
+    """
+    await connection.execute(*bind(assignment.RELEASE_SQL, {
+        'courier_id': courier_id,
+        'capacity': capacity,
+        'regions': regions,
+        'courier_intervals': courier_intervals,
+        'now': datetime.datetime.now()
+    }))
+
+
+async def get_courier_load(connection, courier_id: int):
+    """
+    the same query as assignment.get_courier_load
+    :return: row with courier columns, weight and ids of orders in flight, or None
+    """
+    return await connection.fetchrow(*bind(assignment.COURIER_LOAD_SQL, {'courier_id': courier_id}))
+
+
+async def get_courier_candidates(connection, courier, weight: float) -> [tuple]:
+    """
+    the same queries as assignment.get_courier_candidates without the index of orders
+    :return: orders planned for courier, or candidate orders of the backlog without a plan
+    """
+    params = {
+        'regions': courier.regions,
+        'weight': weight,
+        'courier_intervals': util.get_working_intervals(courier),
+        'courier_id': courier.id
+    }
+    rows = await connection.fetch(*bind(assignment.PLANNED_CANDIDATES_SQL, params))
+    if not rows:
+        rows = await connection.fetch(*bind(assignment.CANDIDATES_SQL, params))
+    return [tuple(row) for row in rows]
+
+
+async def assign_orders(connection, courier_id: int, order_ids: [int], delivery_id: int = None) -> (set, int):
+    """
+    the same statement as assignment.assign_orders
+    :return: assigned ids and id of the delivery
+    """
+    rows = await connection.fetch(*bind(assignment.ASSIGN_SQL, {
+        'courier_id': courier_id,
+        'order_ids': order_ids,
+        'start_date': datetime.datetime.now(),
+        'delivery_id': delivery_id
+    }))
+    if rows:
+        delivery_id = rows[0]['delivery_id']
+
+    return {row['id'] for row in rows}, delivery_id
+
+
+async def get_started_order(connection, order_id: int, courier_id: int):
+    """
+    :return: row of order assigned on courier or None
+    """
+    return await connection.fetchrow(
+        'SELECT id, region, start_date, finish_date, delivery_id FROM orders '
+        'WHERE id = $1 AND courier_id = $2 AND completed_period = 0 AND start_date IS NOT NULL FOR UPDATE',
+        order_id, courier_id
+    )
+
+
+async def get_archived_order_id(connection, order_id: int, courier_id: int):
+    """
+    :return: id of archived order of courier or None
+    """
+    return await connection.fetchval(
+        'SELECT id FROM orders WHERE id = $1 AND courier_id = $2 AND completed_period > 0',
+        order_id, courier_id
+    )
+
+
+async def complete_delivery_order(connection, delivery_id: int, finish_date: datetime.datetime):
+    """
+    the same statement as assignment.complete_delivery_order
+    :return: finish-date of the previous completed order of the delivery, or None for the first one
+    """
+    return await connection.fetchval(*bind(assignment.COMPLETE_SQL, {
+        'delivery_id': delivery_id,
+        'finish_date': finish_date
+    }))
+
+
+async def load_completed_orders(connection, order_ids: [int]) -> [dict]:
+    """
+    the same queries as completion.load_orders
+    :return: rows of started orders
+    """
+    rows = await connection.fetch(*bind(completion.LOAD_SQL, {'order_ids': order_ids}))
+    found_ids = {row['id'] for row in rows}
+    missing_ids = [order_id for order_id in order_ids if order_id not in found_ids]
+    if missing_ids:
+        rows += await connection.fetch(*bind(completion.LOAD_ARCHIVED_SQL, {'order_ids': missing_ids}))
+    return rows
+
+
+async def lock_deliveries(connection, orders: dict) -> dict:
+    """
+    the same query as completion.lock_deliveries
+    :return: last_finish_at by id of delivery
+    """
+    delivery_ids = sorted({order.delivery_id for order in orders.values() if order.delivery_id is not None})
+    if not delivery_ids:
+        return {}
+    rows = await connection.fetch(*bind(completion.LOCK_DELIVERIES_SQL, {'delivery_ids': delivery_ids}))
+    return {row['id']: row['last_finish_at'] for row in rows}
+
+
+async def save_completions(connection, completions: [tuple]) -> None:
+    """
+    the same statement as completion.save_completions
+    :param completions: (order_id, finish_date, delivery_time) of completion.plan_completions
+    """
+    if not completions:
+        return
+    order_ids, finish_dates, delivery_times = zip(*completions)
+    await connection.execute(*bind(completion.SAVE_SQL, {
+        'order_ids': list(order_ids),
+        'finish_dates': list(finish_dates),
+        'delivery_times': list(delivery_times)
+    }))
+
+
+async def complete_order(connection, order_id: int, courier_id: int, region: int,
+                         finish_date: datetime.datetime, delivery_time: float) -> None:
+    """
+    save finish of order and add its delivery-time to courier`s statistic
+    """
+    await connection.execute(
+        'UPDATE orders SET finish_date = $2, delivery_time = $3 WHERE id = $1 AND completed_period = 0',
+        order_id, finish_date, delivery_time
+    )
+    await connection.execute(
+        'INSERT INTO courier_region_stats (courier_id, region, delivery_time_sum, delivery_count) '
+        'VALUES ($1, $2, $3, 1) '
+        'ON CONFLICT (courier_id, region) DO UPDATE SET '
+        'delivery_time_sum = courier_region_stats.delivery_time_sum + excluded.delivery_time_sum, '
+        'delivery_count = courier_region_stats.delivery_count + excluded.delivery_count',
+        courier_id, region, delivery_time
+    )
@@ -1,35 +1,14 @@
 import flask
 from flask import request
-from flask_restful import Resource, fields, marshal
+from flask_restful import Resource
 
-from app.models import Courier, Order, db
-from app.services import util
+from app.models import Courier, db
+from app.services import assignment, serializer, util
+from app.services.bulk import bulk_insert
+from app.services.cache import CacheBackend, courier_key
 from app.services.data_validator import Validator
-from app.services.util import Object
-
-courier_fields = {
-    'id': fields.Integer(attribute='id')
-}
-
-courier_list_fields = {
-    'couriers': fields.List(fields.Nested(courier_fields))
-}
-
-patch_courier_fields = {
-    'courier_id': fields.Integer(attribute='id'),
-    'courier_type': fields.String,
-    'regions': fields.List(fields.Integer),
-    'working_hours': fields.List(fields.String)
-}
-
-courier_get_fields = {
-    'courier_id': fields.Integer(attribute='id'),
-    'courier_type': fields.String,
-    'regions': fields.List(fields.Integer),
-    'working_hours': fields.List(fields.String),
-    'rating': fields.Float,
-    'earnings': fields.Integer
-}
+from app.services.order_index import OrderIndex
+from app.services.streaming import NDJSON_MIMETYPE, import_ndjson
 
 
 class Couriers(Resource):
@@ -38,19 +17,30 @@ class Couriers(Resource):
     :arg
     validator : Validator
         validate the json-body
+    cache : CacheBackend
+        cache of couriers with statistic
+    order_index : OrderIndex
+        index of unassigned orders, or None
     """
 
-    def __init__(self, validator: Validator) -> None:
+    def __init__(self, validator: Validator, cache: CacheBackend, order_index: OrderIndex) -> None:
         super().__init__()
         self.validator = validator
+        self.cache = cache
+        self.order_index = order_index
 
     def post(self):
         """
-        create couriers by json of the request body
+        create couriers by json of the request body,
+        or by ndjson-body with one courier per line which is processed as a stream
         :returns response with ids of new couriers and status 201
         :raises
             return response with status 400 if json-body is not validated
         """
+        if request.mimetype == NDJSON_MIMETYPE:
+            return import_ndjson(request.stream, self.validator.validate_courier_entities, util.get_courier_row,
+                                 Courier, 'couriers')
+
         json_data = request.get_json(force=True)
         validate_result = self.validator.validate_post_courier(json_data)
         if not validate_result[0]:
@@ -59,24 +49,13 @@ class Couriers(Resource):
             else:
                 return flask.Response(status=400)
 
-        couriers = []
-        for data in json_data['data']:
-            courier = Courier(
-                id=data['courier_id'],
-                courier_type=data['courier_type'],
-                regions=data['regions'],
-                working_hours=data['working_hours']
-            )
-            couriers.append(courier)
-            db.session.add(courier)
-
+        couriers = [util.get_courier_row(data) for data in json_data['data']]
+        bulk_insert(Courier, couriers)
         db.session.commit()
 
-        result = Object()
-        result.couriers = couriers
-        return marshal(result, courier_list_fields), 201
+        return serializer.response(serializer.dump_id_list('couriers', [courier['id'] for courier in couriers]), 201)
 
-    def get(self, courier_id: int):
+    def get(self, courier_id: int = None):
         """
         return courier with statistic by courier_id
         :param courier_id: int
@@ -84,13 +63,63 @@ class Couriers(Resource):
         :raises
             return response with status 400 if courier is not exists
         """
+        if courier_id is None:
+            return self.get_list()
+
+        key = courier_key(courier_id)
+        token = self.cache.begin(key)
+        result = self.cache.get(key)
+        if result is not None:
+            return result, 200
+
         courier = Courier.query.filter_by(id=courier_id).first()
         if not courier:
             return flask.Response(status=400)
         courier.rating = util.get_courier_rating(courier)
         courier.earnings = util.get_earnings(courier)
+        result = serializer.courier_statistic_to_dict(courier)
+        self.cache.set(key, result, token)
+
+        return result, 200
+
+    def get_list(self):
+        """
+        return couriers with statistic by ids=1,2,3 of the query string in the same order,
+        or page of all couriers by after_id and limit,
+        couriers are streamed one per line if ndjson is accepted
+        :returns response with couriers and status 200, not existing ids are skipped
+        :raises
+            return response with status 400 if arguments are not validated
+        """
+        try:
+            courier_ids = [int(courier_id) for courier_id in request.args['ids'].split(',')] \
+                if 'ids' in request.args else None
+            after_id = int(request.args.get('after_id', 0))
+            limit = int(request.args.get('limit', util.COURIERS_PAGE_SIZE))
+        except ValueError:
+            return flask.Response(status=400)
+        if not 0 < limit <= util.COURIERS_PAGE_MAX \
+                or courier_ids is not None and not 0 < len(courier_ids) <= util.COURIERS_PAGE_MAX:
+            return flask.Response(status=400)
 
-        return marshal(courier, courier_get_fields), 200
+        if request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE:
+            pages = _iter_id_pages(courier_ids) if courier_ids is not None else _iter_all_pages(after_id)
+            return flask.Response(flask.stream_with_context(
+                serializer.dump(serializer.courier_statistic_to_dict(courier)) for page in pages for courier in page
+            ), status=200, mimetype=NDJSON_MIMETYPE)
+
+        next_after_id = None
+        if courier_ids is not None:
+            couriers = _get_couriers_by_ids(courier_ids)
+        else:
+            couriers = _get_couriers_page(after_id, limit)
+            if len(couriers) == limit:
+                next_after_id = couriers[-1].id
+
+        return {
+            'couriers': [serializer.courier_statistic_to_dict(courier) for courier in couriers],
+            'next_after_id': next_after_id
+        }, 200
 
     def patch(self, courier_id):
         """
@@ -104,7 +133,8 @@ class Couriers(Resource):
         validate_result = self.validator.validate_path_courier(json_data)
         if not validate_result:
             return flask.Response(status=400)
-        courier = Courier.query.filter_by(id=courier_id).first()
+        # the courier row lock serializes the update with assignments of the courier
+        courier = Courier.query.filter_by(id=courier_id).with_for_update().first()
         if not courier:
             return flask.Response(status=400)
         if 'courier_type' in json_data:
@@ -112,24 +142,48 @@ class Couriers(Resource):
         if 'regions' in json_data:
             courier.regions = json_data['regions']
         if 'working_hours' in json_data:
-            courier.regions = json_data['working_hours']
-
-        weight = util.get_weight_by_type(courier.courier_type)
-        orders = db.session \
-            .query(Order) \
-            .filter(Order.courier_id == courier.id,
-                    Order.start_date.isnot(None),
-                    Order.finish_date.is_(None)) \
-            .all()
-
-        for order in orders:
-            if order.weight > weight \
-                    or order.region not in courier.regions \
-                    or not util.is_courier_has_time_for_order(courier, order):
-                order.delivery = None
-                order.start_date = None
-                order.courier_id = None
+            courier.working_hours = json_data['working_hours']
+            courier.working_intervals = util.compile_time_ranges(json_data['working_hours'])
+
+        released = assignment.release_unfit_orders(courier.id,
+                                                   util.get_weight_by_type(courier.courier_type),
+                                                   courier.regions,
+                                                   util.get_working_intervals(courier))
 
         db.session.commit()
+        self.cache.delete(courier_key(courier.id))
+        if self.order_index is not None and released:
+            self.order_index.add([tuple(order) for order in released])
+
+        return serializer.courier_to_dict(courier), 200
+
+
+def _get_couriers_by_ids(courier_ids: [int]) -> [Courier]:
+    """
+    :return: existing couriers with statistic in order of ids
+    """
+    couriers = {courier.id: courier for courier in Courier.query.filter(Courier.id.in_(courier_ids)).all()}
+    util.set_couriers_statistic(list(couriers.values()))
+    return [couriers[courier_id] for courier_id in courier_ids if courier_id in couriers]
+
+
+def _get_couriers_page(after_id: int, limit: int) -> [Courier]:
+    """
+    :return: couriers with statistic after after_id by id
+    """
+    couriers = Courier.query.filter(Courier.id > after_id).order_by(Courier.id).limit(limit).all()
+    util.set_couriers_statistic(couriers)
+    return couriers
+
+
+def _iter_id_pages(courier_ids: [int]):
+    for i in range(0, len(courier_ids), util.COURIERS_PAGE_SIZE):
+        yield _get_couriers_by_ids(courier_ids[i:i + util.COURIERS_PAGE_SIZE])
+
 
-        return marshal(courier, patch_courier_fields), 200
+def _iter_all_pages(after_id: int):
+    page = _get_couriers_page(after_id, util.COURIERS_PAGE_MAX)
+    while page:
+        yield page
+        db.session.expunge_all()
+        page = _get_couriers_page(page[-1].id, util.COURIERS_PAGE_MAX)
@@ -2,23 +2,15 @@ import datetime
 
 import flask
 from flask import request
-from flask_restful import Resource, marshal, fields
+from flask_restful import Resource
 
-from app.models import Order, Courier, Delivery, db
-from app.services import util
-from app.services.util import Object
-
-order_fields = {
-    'id': fields.Integer(attribute='id')
-}
-
-order_list_fields = {
-    'orders': fields.List(fields.Nested(order_fields))
-}
-
-order_complete_fields = {
-    'order_id': fields.Integer(attribute='id')
-}
+from app.models import ACTIVE_PERIOD, Order, Courier, db
+from app.services import assignment, completion, serializer, util
+from app.services.bulk import bulk_insert
+from app.services.cache import courier_key
+from app.services.matcher import ASSIGN_CLAIM_ATTEMPTS, OrderBatch, OrderClaim
+from app.services.order_index import to_order_tuple
+from app.services.streaming import NDJSON_MIMETYPE, import_ndjson
 
 
 class Orders(Resource):
@@ -27,19 +19,34 @@ class Orders(Resource):
     :arg
     validator : Validator
         validate the json-body
+    order_index : OrderIndex
+        index of unassigned orders, or None
     """
 
-    def __init__(self, validator) -> None:
+    def __init__(self, validator, order_index) -> None:
         super().__init__()
         self.validator = validator
+        self.order_index = order_index
 
     def post(self):
         """
-        create orders by json of the request body
+        create orders by json of the request body,
+        or by ndjson-body with one order per line which is processed as a stream
         :returns response with list new ids of orders and status 201
         :raises
             return response with status 400 if json-body is not validated
         """
+        if request.mimetype == NDJSON_MIMETYPE:
+            if self.order_index is None:
+                return import_ndjson(request.stream, self.validator.validate_order_entities, util.get_order_row,
+                                     Order, 'orders')
+            # uncommitted orders can not be claimed, so they are added to the index after commit
+            inserted = []
+            return import_ndjson(request.stream, self.validator.validate_order_entities, util.get_order_row,
+                                 Order, 'orders',
+                                 on_insert=lambda rows: inserted.extend(to_order_tuple(row) for row in rows),
+                                 on_commit=lambda: self.order_index.add(inserted))
+
         json_data = request.get_json(force=True)
         validate_result = self.validator.validate_post_order(json_data)
         if not validate_result[0]:
@@ -48,22 +55,19 @@ class Orders(Resource):
             else:
                 return flask.Response(status=400)
 
-        orders = []
-        for data in json_data['data']:
-            order = Order(
-                id=data['order_id'],
-                weight=round(data['weight'], 2),
-                region=data['region'],
-                delivery_hours=data['delivery_hours']
-            )
-            orders.append(order)
-            db.session.add(order)
-
+        orders = [util.get_order_row(data) for data in json_data['data']]
+        bulk_insert(Order, orders)
         db.session.commit()
+        self.add_to_index(orders)
 
-        result = Object()
-        result.orders = orders
-        return marshal(result, order_list_fields), 201
+        return serializer.response(serializer.dump_id_list('orders', [order['id'] for order in orders]), 201)
+
+    def add_to_index(self, orders: [dict]) -> None:
+        """
+        :param orders: values of columns of new orders
+        """
+        if self.order_index is not None:
+            self.order_index.add([to_order_tuple(order) for order in orders])
 
 
 class AssignOrders(Resource):
@@ -72,11 +76,20 @@ class AssignOrders(Resource):
     :arg
         validator : Validator
             validate the json-body
+        strategy : function
+            choose orders which fit into free capacity of courier
+        cache : CacheBackend
+            cache of couriers with statistic
+        order_index : OrderIndex
+            index of unassigned orders which is searched instead of the table, or None
     """
 
-    def __init__(self, validator) -> None:
+    def __init__(self, validator, strategy, cache, order_index) -> None:
         super().__init__()
         self.validator = validator
+        self.strategy = strategy
+        self.cache = cache
+        self.order_index = order_index
 
     def post(self):
         """
@@ -90,44 +103,34 @@ class AssignOrders(Resource):
         if not validate_result:
             return flask.Response(status=400)
 
-        courier = Courier.query.filter_by(id=json_data['courier_id']).first()
+        courier = assignment.get_courier_load(json_data['courier_id'])
         if not courier:
             return flask.Response(status=400)
-        weight = util.get_weight_by_type(courier.courier_type)
 
-        orders = db.session \
-            .query(Order) \
-            .filter(Order.region.in_(courier.regions),
-                    Order.start_date.is_(None),
-                    Order.finish_date.is_(None),
-                    Order.courier_id.is_(None),
-                    Order.weight <= weight) \
-            .all()
-
-        have_new_orders = False
-
-        delivery = Delivery()
-        for order in orders:
-            start_date = datetime.datetime.now()
-            if util.is_courier_has_time_for_order(courier, order):
-                order.courier_id = courier.id
-                order.start_date = start_date
-                have_new_orders = True
-                order.delivery = delivery
-
-        if have_new_orders:
-            courier.count_delivery += 1
-            db.session.add(delivery)
+        weight = util.get_weight_by_type(courier.courier_type) - courier.assigned_weight
+        candidates = assignment.get_courier_candidates(courier, weight, self.order_index)
+
+        # candidates are already filtered by the database, the strategy only packs them
+        batch = OrderBatch(candidates)
+        claim = OrderClaim(batch, list(range(len(batch))), weight, self.strategy, ASSIGN_CLAIM_ATTEMPTS)
+        delivery_id = None
+        failed_ids = []
+        chosen_ids = claim.choose()
+        while chosen_ids:
+            claimed_ids, delivery_id = assignment.assign_orders(courier.id, chosen_ids, delivery_id)
+            claim.claimed(claimed_ids)
+            failed_ids += [order_id for order_id in chosen_ids if order_id not in claimed_ids]
+            chosen_ids = claim.choose()
 
         db.session.commit()
-        result = Object()
-        result.orders = db.session \
-            .query(Order) \
-            .filter(Order.start_date.isnot(None),
-                    Order.finish_date.is_(None),
-                    Order.courier_id == courier.id) \
-            .all()
-        return marshal(result, order_list_fields), 200
+        if claim.order_ids:
+            # earnings depend on count of deliveries
+            self.cache.delete(courier_key(courier.id))
+        if self.order_index is not None:
+            # orders which failed to claim are taken by other processes
+            self.order_index.remove(claim.order_ids + failed_ids)
+        order_ids = sorted((courier.assigned_ids or []) + claim.order_ids)
+        return serializer.response(serializer.dump_id_list('orders', order_ids), 200)
 
 
 class CompleteOrder(Resource):
@@ -135,11 +138,14 @@ class CompleteOrder(Resource):
     :arg
         validator : Validator
             validate the json-body
+        cache : CacheBackend
+            cache of couriers with statistic
     """
 
-    def __init__(self, validator) -> None:
+    def __init__(self, validator, cache) -> None:
         super().__init__()
         self.validator = validator
+        self.cache = cache
 
     def post(self):
         """
@@ -159,26 +165,77 @@ class CompleteOrder(Resource):
             .query(Order) \
             .filter(Order.id == json_data['order_id'],
                     Order.courier_id == courier.id,
+                    Order.completed_period == ACTIVE_PERIOD,
                     Order.start_date.isnot(None)) \
+            .with_for_update() \
             .first()
         if not order:
-            return flask.Response(status=400)
-        if order.finish_date is None:
-            last_completed_order = db.session \
-                .query(Order) \
-                .filter(Order.courier_id == courier.id,
-                        Order.delivery_id == order.delivery_id,
-                        Order.finish_date.isnot(None)) \
-                .order_by(Order.finish_date.desc()) \
+            # archived orders are completed long ago
+            archived = db.session \
+                .query(Order.id) \
+                .filter(Order.id == json_data['order_id'],
+                        Order.courier_id == courier.id,
+                        Order.completed_period > ACTIVE_PERIOD) \
                 .first()
-
-            start_date = order.start_date
-            if last_completed_order:
-                start_date = last_completed_order.finish_date
-
+            if not archived:
+                return flask.Response(status=400)
+            db.session.commit()
+            return {'order_id': archived.id}, 200
+        completed = order.finish_date is None
+        if completed:
             order.finish_date = datetime.datetime.now()
+            # the order is delivered since the previous order of the delivery or since the assignment
+            start_date = assignment.complete_delivery_order(order.delivery_id, order.finish_date) or order.start_date
             delivery_time = order.finish_date - start_date
             order.delivery_time = delivery_time.total_seconds()
+            util.add_delivery_time(courier.id, order.region, order.delivery_time)
 
         db.session.commit()
-        return marshal(order, order_complete_fields), 200
+        if completed:
+            # rating depends on delivery-times
+            self.cache.delete(courier_key(courier.id))
+        return {'order_id': order.id}, 200
+
+
+class CompleteOrders(Resource):
+    """CompleteOrders class used for HTTP requests related to complete orders by batches,
+    like completions synced by courier`s app after it was offline
+    :arg
+        validator : Validator
+            validate the json-body
+        cache : CacheBackend
+            cache of couriers with statistic
+    """
+
+    def __init__(self, validator, cache) -> None:
+        super().__init__()
+        self.validator = validator
+        self.cache = cache
+
+    def post(self):
+        """
+        complete orders at complete_time of every item in one transaction
+        :return: response with status of every item with status 200:
+            completed, already_completed, not_found if order is not assigned on courier,
+            or invalid if the item is not validated
+        :raises
+            return response with code 400 if json-body is not validated or some item has no order_id
+        """
+        json_data = request.get_json(force=True)
+        complete_times = self.validator.validate_complete_orders(json_data)
+        if complete_times is None:
+            return flask.Response(status=400)
+        items = json_data['data']
+
+        order_ids = {item['order_id'] for item, complete_time in zip(items, complete_times) if complete_time}
+        orders = completion.load_orders(sorted(order_ids))
+        last_finishes = completion.lock_deliveries(orders)
+        statuses, completions = completion.plan_completions(items, complete_times, orders, last_finishes,
+                                                            datetime.datetime.now())
+        completion.save_completions(completions)
+        db.session.commit()
+
+        # rating depends on delivery-times
+        for courier_id in {orders[order_id].courier_id for order_id, _, _ in completions}:
+            self.cache.delete(courier_key(courier_id))
+        return {'orders': [{'id': item['order_id'], 'status': status} for item, status in zip(items, statuses)]}, 200
@@ -0,0 +1,59 @@
+import flask
+from flask_restful import Resource
+
+from app.models import db
+from app.services import metrics
+from app.services.pool import get_pool_metrics
+
+
+class PoolStatus(Resource):
+    """
+    PoolStatus class used for HTTP requests related to database connection pool of the worker process
+    """
+
+    def get(self):
+        """
+        return state of connection pool
+        :returns response with pool metrics and status 200
+        """
+        return get_pool_metrics(db.engine), 200
+
+
+class Metrics(Resource):
+    """
+    Metrics class used for HTTP requests related to metrics of requests of the worker process
+    """
+
+    def get(self):
+        """
+        return metrics of requests and connection pool in prometheus text format
+        :returns response with metrics and status 200
+        """
+        gauges = {f'db_pool_{name}': value for name, value in get_pool_metrics(db.engine).items()}
+        return flask.Response(metrics.REGISTRY.render(gauges), status=200, content_type=metrics.CONTENT_TYPE)
+
+
+class OrderIndexStatus(Resource):
+    """
+    OrderIndexStatus class used for HTTP requests related to the index of unassigned orders of the worker process
+    :arg
+        order_index : OrderIndex
+            index of unassigned orders, or None
+    """
+
+    def __init__(self, order_index) -> None:
+        super().__init__()
+        self.order_index = order_index
+
+    def get(self):
+        """
+        compare the index with the database
+        :returns response with size of the index, counts of missing and stale orders and status 200
+        :raises
+            return response with status 404 if the index is off
+        """
+        if self.order_index is None:
+            return flask.Response(status=404)
+        result = self.order_index.check()
+        db.session.rollback()
+        return result, 200
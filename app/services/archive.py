@@ -0,0 +1,92 @@
+"""
+archival of completed orders: orders completed earlier than ARCHIVE_AFTER_DAYS ago are moved from the active
+partition of orders to partitions by month of completion, queries of orders in work read only the active partition.
+Delivery-times are chained by deliveries.last_finish_at and the rating is read from courier_region_stats,
+so archived orders are not read by requests
+"""
+import datetime
+import os
+
+from sqlalchemy import text
+
+from app.models import ACTIVE_PERIOD, Order, db
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 10000))
+
+# an update of the partition key moves the row to the partition of the period
+ARCHIVE_SQL = """WITH archived AS (
+    SELECT id FROM orders
+    WHERE completed_period = 0 AND finish_date IS NOT NULL AND finish_date < :before
+    ORDER BY finish_date
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE orders
+SET completed_period = CAST(to_char(orders.finish_date, 'YYYYMM') AS integer)
+FROM archived
+WHERE orders.id = archived.id AND orders.completed_period = 0"""
+
+
+def get_period(date: datetime.datetime) -> int:
+    """
+    :return: completed_period of orders completed at date, like 202101
+    """
+    return date.year * 100 + date.month
+
+
+def get_periods(first: datetime.datetime, last: datetime.datetime) -> [int]:
+    """
+    :return: periods of months from first to last date inclusive
+    """
+    periods = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        periods.append(year * 100 + month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+def create_partitions(periods: [int]) -> None:
+    """
+    create partitions of orders for periods which have no partition yet, commit is up to the caller
+    :param periods:
+    """
+    for period in periods:
+        db.session.execute(text(f'CREATE TABLE IF NOT EXISTS orders_{period} PARTITION OF orders '
+                                f'FOR VALUES FROM ({period}) TO ({period + 1})'))
+
+
+def archive_orders(days: float = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> dict:
+    """
+    move orders completed earlier than days ago to partitions by month, every batch is committed,
+    orders locked by requests are skipped until the next run
+    :param days: age of completed orders which are archived
+    :param batch_size: count of orders moved in one transaction
+    :return: statistic of the run
+    """
+    before = datetime.datetime.now() - datetime.timedelta(days=days)
+    first = db.session \
+        .query(Order.finish_date) \
+        .filter(Order.completed_period == ACTIVE_PERIOD,
+                Order.finish_date.isnot(None)) \
+        .order_by(Order.finish_date) \
+        .limit(1) \
+        .scalar()
+    if first is None or first >= before:
+        db.session.rollback()
+        return {'archived': 0, 'partitions': []}
+
+    periods = get_periods(first, before)
+    create_partitions(periods)
+    db.session.commit()
+
+    archived = 0
+    while True:
+        count = db.session.execute(text(ARCHIVE_SQL), {'before': before, 'batch_size': batch_size}).rowcount
+        db.session.commit()
+        archived += count
+        if count < batch_size:
+            break
+
+    return {'archived': archived, 'partitions': [f'orders_{period}' for period in periods]}
@@ -0,0 +1,205 @@
+"""
+set-based queries of assignment of orders, the eligibility of orders is checked by the database
+and chosen orders are locked and assigned by one statement
+"""
+import datetime
+
+from sqlalchemy import ARRAY, Integer, bindparam, text
+
+from app.models import db
+from app.services import util
+
+# the same check as util.is_intervals_fit on range columns of orders, windows which cross midnight are split
+# by intervals_to_ranges like by util.split_intervals. The span overlap is checked by the gist index,
+# then ranges are compared exactly
+RANGES_FIT_SQL = """(orders.delivery_span && intervals_span(CAST(:courier_intervals AS integer[]))
+AND EXISTS (
+    SELECT 1
+    FROM unnest(orders.delivery_ranges) AS order_window(window_range),
+         unnest(intervals_to_ranges(CAST(:courier_intervals AS integer[]))) AS courier_window(window_range)
+    WHERE courier_window.window_range @> order_window.window_range
+))"""
+
+COURIER_LOAD_SQL = """SELECT id, courier_type, regions, working_hours, working_intervals,
+       (SELECT coalesce(sum(weight), 0) FROM orders
+        WHERE orders.courier_id = couriers.id AND completed_period = 0
+        AND start_date IS NOT NULL AND finish_date IS NULL) AS assigned_weight,
+       (SELECT array_agg(id) FROM orders
+        WHERE orders.courier_id = couriers.id AND completed_period = 0
+        AND start_date IS NOT NULL AND finish_date IS NULL) AS assigned_ids
+FROM couriers
+WHERE id = :courier_id
+FOR UPDATE OF couriers"""
+
+CANDIDATES_FILTER = f"""region = ANY(CAST(:regions AS integer[])) AND completed_period = 0
+AND start_date IS NULL AND finish_date IS NULL AND courier_id IS NULL
+AND weight <= :weight AND {RANGES_FIT_SQL}"""
+
+CANDIDATES_SQL = f"""SELECT id, weight, region, delivery_intervals FROM orders
+WHERE {CANDIDATES_FILTER}
+ORDER BY id"""
+
+# orders planned for the courier by the dispatcher are read by ix_orders_unassigned_planned_courier
+PLANNED_CANDIDATES_SQL = f"""SELECT id, weight, region, delivery_intervals FROM orders
+WHERE planned_courier_id = :courier_id AND {CANDIDATES_FILTER}
+ORDER BY id"""
+
+ASSIGN_SQL = """WITH claimed AS (
+    SELECT id FROM orders
+    WHERE id = ANY(CAST(:order_ids AS integer[])) AND completed_period = 0
+    AND courier_id IS NULL AND start_date IS NULL
+    FOR UPDATE SKIP LOCKED
+), delivery AS (
+    INSERT INTO deliveries (id, courier_id, remaining_count)
+    SELECT nextval(pg_get_serial_sequence('deliveries', 'id')), :courier_id, (SELECT count(*) FROM claimed)
+    WHERE CAST(:delivery_id AS integer) IS NULL AND EXISTS (SELECT 1 FROM claimed)
+    RETURNING id
+), grown AS (
+    UPDATE deliveries SET remaining_count = remaining_count + (SELECT count(*) FROM claimed)
+    WHERE id = CAST(:delivery_id AS integer) AND EXISTS (SELECT 1 FROM claimed)
+), courier AS (
+    UPDATE couriers SET count_delivery = count_delivery + 1
+    WHERE id = :courier_id AND EXISTS (SELECT 1 FROM delivery)
+)
+UPDATE orders
+SET courier_id = :courier_id,
+    start_date = :start_date,
+    delivery_id = COALESCE(CAST(:delivery_id AS integer), (SELECT id FROM delivery))
+FROM claimed
+WHERE orders.id = claimed.id AND orders.completed_period = 0
+RETURNING orders.id, orders.delivery_id"""
+
+# orders which still fit are kept by assignment while their total weight fits into the capacity,
+# deliveries lose released orders, a delivery without orders left in flight is closed
+RELEASE_SQL = f"""WITH in_flight AS (
+    SELECT id, delivery_id, start_date, round(CAST(weight AS numeric), 2) AS weight,
+           (round(CAST(weight AS numeric), 2) > CAST(:capacity AS numeric)
+            OR region <> ALL(CAST(:regions AS integer[])) OR NOT {RANGES_FIT_SQL}) AS unfit
+    FROM orders
+    WHERE courier_id = :courier_id AND completed_period = 0 AND start_date IS NOT NULL AND finish_date IS NULL
+    FOR UPDATE
+), released AS (
+    SELECT id, delivery_id FROM (
+        SELECT id, delivery_id, unfit,
+               sum(CASE WHEN unfit THEN 0 ELSE weight END) OVER (ORDER BY start_date, id) AS load
+        FROM in_flight
+    ) AS kept
+    WHERE unfit OR load > CAST(:capacity AS numeric)
+), delivery AS (
+    UPDATE deliveries
+    SET remaining_count = deliveries.remaining_count - released_count.count,
+        closed_at = CASE WHEN deliveries.remaining_count = released_count.count THEN :now
+                         ELSE deliveries.closed_at END
+    FROM (SELECT delivery_id, count(*) AS count FROM released GROUP BY delivery_id) AS released_count
+    WHERE deliveries.id = released_count.delivery_id
+)
+UPDATE orders
+SET courier_id = NULL,
+    start_date = NULL,
+    delivery_id = NULL
+FROM released
+WHERE orders.id = released.id AND orders.completed_period = 0
+RETURNING orders.id, orders.weight, orders.region, orders.delivery_intervals"""
+
+# the previous finish is read from the locked row, RETURNING only has new values
+COMPLETE_SQL = """UPDATE deliveries
+SET last_finish_at = :finish_date,
+    completed_count = deliveries.completed_count + 1,
+    remaining_count = deliveries.remaining_count - 1,
+    closed_at = CASE WHEN deliveries.remaining_count = 1 THEN CAST(:finish_date AS timestamp) END
+FROM (SELECT id, last_finish_at FROM deliveries WHERE id = :delivery_id FOR UPDATE) AS previous
+WHERE deliveries.id = previous.id
+RETURNING previous.last_finish_at"""
+
+
+def get_courier_load(courier_id: int):
+    """
+    lock courier and find its orders in flight by one query,
+    the courier row lock serializes assignments of one courier
+    :param courier_id:
+    :return: row with courier columns, weight and ids of orders in flight, or None
+    """
+    return db.session.execute(text(COURIER_LOAD_SQL), {'courier_id': courier_id}).first()
+
+
+def get_candidate_orders(regions: [int], weight: float, courier_intervals: [int], courier_id: int = None,
+                         sql: str = CANDIDATES_SQL) -> [tuple]:
+    """
+    :param courier_id: courier whose orders planned by the dispatcher are returned by PLANNED_CANDIDATES_SQL
+    :param sql: CANDIDATES_SQL or PLANNED_CANDIDATES_SQL
+    :return: (id, weight, region, delivery_intervals) of unassigned orders which courier can accept
+    """
+    return db.session.execute(
+        text(sql).bindparams(bindparam('regions', list(regions), type_=ARRAY(Integer)),
+                             bindparam('courier_intervals', list(courier_intervals), type_=ARRAY(Integer))),
+        {'weight': weight, 'courier_id': courier_id}
+    ).fetchall()
+
+
+def get_courier_candidates(courier, weight: float, order_index=None) -> [tuple]:
+    """
+    orders planned for courier by the dispatcher are preferred, the plan is checked again
+    because courier or its load could change since the plan. Only without a plan the backlog is searched
+    :param courier: row of get_courier_load
+    :param weight: free capacity of courier
+    :param order_index: OrderIndex which is searched instead of the table, or None
+    :return: candidate orders like get_candidate_orders
+    """
+    courier_intervals = util.get_working_intervals(courier)
+    candidates = get_candidate_orders(courier.regions, weight, courier_intervals, courier.id,
+                                      PLANNED_CANDIDATES_SQL)
+    if candidates:
+        return candidates
+    if order_index is None:
+        return get_candidate_orders(courier.regions, weight, courier_intervals)
+    return order_index.get_candidate_orders(courier.regions, weight, courier_intervals)
+
+
+def assign_orders(courier_id: int, order_ids: [int], delivery_id: int = None) -> (set, int):
+    """
+    lock chosen orders which are still unassigned, skipping orders locked by concurrent requests,
+    and assign them on courier, the delivery is created and counted on the first assigned orders
+    :param courier_id:
+    :param order_ids: chosen ids
+    :param delivery_id: delivery of previous attempt, or None
+    :return: assigned ids and id of the delivery
+    """
+    rows = db.session.execute(
+        text(ASSIGN_SQL).bindparams(bindparam('order_ids', order_ids, type_=ARRAY(Integer))),
+        {'courier_id': courier_id, 'start_date': datetime.datetime.now(), 'delivery_id': delivery_id}
+    ).fetchall()
+    if rows:
+        delivery_id = rows[0].delivery_id
+
+    return {row.id for row in rows}, delivery_id
+
+
+def release_unfit_orders(courier_id: int, capacity: float, regions: [int], courier_intervals: [int]) -> [tuple]:
+    """
+    unassign orders in flight which courier can not deliver anymore by one statement,
+    the latest assigned orders are released while the total weight exceeds the capacity.
+    Commit is up to the caller
+    :param courier_id:
+    :param capacity: max weight of courier`s type
+    :param regions: courier`s regions
+    :param courier_intervals: compiled working-hours
+    :return: (id, weight, region, delivery_intervals) of released orders
+    """
+    return db.session.execute(
+        text(RELEASE_SQL).bindparams(bindparam('regions', list(regions), type_=ARRAY(Integer)),
+                                     bindparam('courier_intervals', list(courier_intervals), type_=ARRAY(Integer))),
+        {'courier_id': courier_id, 'capacity': capacity, 'now': datetime.datetime.now()}
+    ).fetchall()
+
+
+def complete_delivery_order(delivery_id: int, finish_date: datetime.datetime):
+    """
+    count completed order of the delivery and move its last finish, the delivery row is locked
+    until commit so completions of one delivery are serialized. Commit is up to the caller
+    :param delivery_id:
+    :param finish_date: finish-date of completed order
+    :return: finish-date of the previous completed order of the delivery, or None for the first one
+    """
+    return db.session.execute(
+        text(COMPLETE_SQL), {'delivery_id': delivery_id, 'finish_date': finish_date}
+    ).scalar()
@@ -0,0 +1,26 @@
+import os
+
+from psycopg2.extras import execute_values
+
+from app.models import db
+
+BULK_INSERT_BATCH_SIZE = int(os.environ.get('BULK_INSERT_BATCH_SIZE', 1000))
+
+
+def bulk_insert(model, rows: [dict], batch_size: int = BULK_INSERT_BATCH_SIZE) -> None:
+    """
+    insert rows with multi-row INSERT statements in the session transaction, commit is up to the caller
+    :param model: model of rows
+    :param rows: values of columns, all rows have the same keys
+    :param batch_size: count of rows in one statement
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+    statement = f'INSERT INTO {model.__tablename__} ({", ".join(columns)}) VALUES %s'
+    cursor = db.session.connection().connection.cursor()
+    try:
+        execute_values(cursor, statement, [tuple(row[column] for column in columns) for row in rows],
+                       page_size=batch_size)
+    finally:
+        cursor.close()
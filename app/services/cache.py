@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+COURIER_CACHE_TTL = float(os.environ.get('COURIER_CACHE_TTL', 5))
+COURIER_CACHE_SIZE = int(os.environ.get('COURIER_CACHE_SIZE', 10000))
+
+
+class CacheBackend(ABC):
+    """
+    CacheBackend class is the interface of response caches,
+    a value loaded from the database is only saved if the key was not invalidated while loading:
+        token = cache.begin(key)
+        value = cache.get(key) or load()
+        cache.set(key, value, token)
+    """
+
+    @abstractmethod
+    def begin(self, key: str):
+        """
+        :return: token of the current version of the key
+        """
+
+    @abstractmethod
+    def get(self, key: str):
+        """
+        :return: cached value or None
+        """
+
+    @abstractmethod
+    def set(self, key: str, value, token) -> None:
+        """
+        save value if the key was not invalidated since begin
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        invalidate the key
+        """
+
+
+class NullCache(CacheBackend):
+    """
+    NullCache class caches nothing
+    """
+
+    def begin(self, key: str):
+        return None
+
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value, token) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    LRUCache class is in-process cache with max size and ttl, it is not shared by gunicorn workers,
+    so writes served by other workers are only seen after ttl.
+    Versions of the latest max_size invalidated keys are kept, a value of a key whose version was dropped
+    is only saved if the load began after the drop
+    :arg
+        max_size : int
+            count of keys
+        ttl : float
+            seconds
+    """
+
+    def __init__(self, max_size: int = COURIER_CACHE_SIZE, ttl: float = COURIER_CACHE_TTL) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        # count of invalidations, a version of key is the count at its last invalidation
+        self._clock = 0
+        self._versions = OrderedDict()
+        # the latest version which was dropped
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def begin(self, key: str):
+        with self._lock:
+            return self._clock
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: str, value, token) -> None:
+        with self._lock:
+            if self._versions.get(key, self._dropped) > token:
+                return
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+            self._clock += 1
+            self._versions[key] = self._clock
+            self._versions.move_to_end(key)
+            while len(self._versions) > self.max_size:
+                self._dropped = self._versions.popitem(last=False)[1]
+
+
+class RedisCache(CacheBackend):
+    """
+    RedisCache class keeps values in redis as json, so invalidation is seen by all workers
+    :arg
+        client : redis.Redis
+            or other client with get, set, delete, incr and pipeline
+        ttl : float
+            seconds
+    """
+
+    def __init__(self, client, ttl: float = COURIER_CACHE_TTL) -> None:
+        self.client = client
+        self.ttl = ttl
+
+    @staticmethod
+    def _version_key(key: str) -> str:
+        return f'{key}:version'
+
+    def begin(self, key: str):
+        return self.client.get(self._version_key(key))
+
+    def get(self, key: str):
+        value = self.client.get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value, token) -> None:
+        version_key = self._version_key(key)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(version_key)
+                if pipe.get(version_key) != token:
+                    return
+                pipe.multi()
+                pipe.set(key, json.dumps(value), px=int(self.ttl * 1000))
+                pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def delete(self, key: str) -> None:
+        with self.client.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.incr(self._version_key(key))
+            pipe.execute()
+
+
+def courier_key(courier_id: int) -> str:
+    return f'courier:{courier_id}'
+
+
+def get_cache() -> CacheBackend:
+    """
+    cache of GET /couriers/$courier_id by environment variable COURIER_CACHE: memory, redis or off
+    :return: cache backend
+    """
+    backend = os.environ.get('COURIER_CACHE', 'off')
+    if backend == 'off' or COURIER_CACHE_TTL <= 0:
+        return NullCache()
+    if backend == 'redis':
+        if redis is None:
+            raise RuntimeError('COURIER_CACHE=redis requires the redis package')
+        return RedisCache(redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://redis:6379/0')))
+    return LRUCache()
@@ -0,0 +1,158 @@
+"""
+batch completion of orders: orders of the batch are checked and locked by one query and their deliveries by another,
+delivery-times are chained by deliveries in memory and orders, statistic of couriers and deliveries are written
+by one statement. Orders are locked before deliveries like in CompleteOrder.post and in assignment
+"""
+import datetime
+
+from sqlalchemy import ARRAY, DateTime, Float, Integer, bindparam, text
+
+from app.models import db
+
+COMPLETED = 'completed'
+ALREADY_COMPLETED = 'already_completed'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+LOAD_SQL = """SELECT id, courier_id, region, start_date, finish_date, delivery_id
+FROM orders
+WHERE id = ANY(CAST(:order_ids AS integer[])) AND completed_period = 0 AND start_date IS NOT NULL
+ORDER BY id
+FOR UPDATE"""
+
+# archived orders are completed long ago, they are only reported as already completed
+LOAD_ARCHIVED_SQL = """SELECT id, courier_id, region, start_date, finish_date, delivery_id
+FROM orders
+WHERE id = ANY(CAST(:order_ids AS integer[])) AND completed_period > 0"""
+
+LOCK_DELIVERIES_SQL = """SELECT id, last_finish_at
+FROM deliveries
+WHERE id = ANY(CAST(:delivery_ids AS integer[]))
+ORDER BY id
+FOR UPDATE"""
+
+SAVE_SQL = """WITH completed AS (
+    UPDATE orders
+    SET finish_date = completed.finish_date,
+        delivery_time = completed.delivery_time
+    FROM unnest(CAST(:order_ids AS integer[]),
+                CAST(:finish_dates AS timestamp[]),
+                CAST(:delivery_times AS double precision[])) AS completed(id, finish_date, delivery_time)
+    WHERE orders.id = completed.id AND orders.completed_period = 0
+    RETURNING orders.courier_id, orders.region, orders.delivery_id, completed.finish_date, completed.delivery_time
+), stats AS (
+    INSERT INTO courier_region_stats (courier_id, region, delivery_time_sum, delivery_count)
+    SELECT courier_id, region, sum(delivery_time), count(*)
+    FROM completed
+    GROUP BY courier_id, region
+    ORDER BY courier_id, region
+    ON CONFLICT (courier_id, region) DO UPDATE SET
+    delivery_time_sum = courier_region_stats.delivery_time_sum + excluded.delivery_time_sum,
+    delivery_count = courier_region_stats.delivery_count + excluded.delivery_count
+)
+UPDATE deliveries
+SET last_finish_at = delivery_completed.last_finish_at,
+    completed_count = deliveries.completed_count + delivery_completed.count,
+    remaining_count = deliveries.remaining_count - delivery_completed.count,
+    closed_at = CASE WHEN deliveries.remaining_count = delivery_completed.count
+                     THEN delivery_completed.last_finish_at ELSE deliveries.closed_at END
+FROM (SELECT delivery_id, max(finish_date) AS last_finish_at, count(*) AS count
+      FROM completed GROUP BY delivery_id) AS delivery_completed
+WHERE deliveries.id = delivery_completed.delivery_id"""
+
+
+def load_orders(order_ids: [int]) -> dict:
+    """
+    lock started orders until commit, orders which are not found in the active partition
+    are looked for in the archive
+    :param order_ids:
+    :return: row of order by id
+    """
+    rows = db.session.execute(
+        text(LOAD_SQL).bindparams(bindparam('order_ids', order_ids, type_=ARRAY(Integer)))
+    ).fetchall()
+    orders = {row.id: row for row in rows}
+    missing_ids = [order_id for order_id in order_ids if order_id not in orders]
+    if missing_ids:
+        rows = db.session.execute(
+            text(LOAD_ARCHIVED_SQL).bindparams(bindparam('order_ids', missing_ids, type_=ARRAY(Integer)))
+        ).fetchall()
+        orders.update((row.id, row) for row in rows)
+    return orders
+
+
+def lock_deliveries(orders: dict) -> dict:
+    """
+    lock deliveries of loaded orders until commit
+    :param orders: rows of load_orders by id
+    :return: last_finish_at by id of delivery
+    """
+    delivery_ids = sorted({order.delivery_id for order in orders.values() if order.delivery_id is not None})
+    if not delivery_ids:
+        return {}
+    return dict(db.session.execute(
+        text(LOCK_DELIVERIES_SQL).bindparams(bindparam('delivery_ids', delivery_ids, type_=ARRAY(Integer)))
+    ).fetchall())
+
+
+def plan_completions(items: [dict], complete_times: list, orders: dict, last_finishes: dict,
+                     now: datetime.datetime) -> ([str], [tuple]):
+    """
+    completions of one delivery are applied by complete_time, every order is delivered since the previous
+    completed order of its delivery or since the assignment like in CompleteOrder.post.
+    An order completed before that time or in the future, or repeated in the batch is invalid
+    :param items: items of json-body
+    :param complete_times: parsed complete_time of every item, or None if the item is not validated
+    :param orders: rows of load_orders by id
+    :param last_finishes: last_finish_at by id of delivery of lock_deliveries
+    :param now: current time
+    :return: status of every item and (order_id, finish_date, delivery_time) of completed orders
+    """
+    statuses = [None] * len(items)
+    seen_order_ids = set()
+    by_delivery = {}
+    for index, (item, complete_time) in enumerate(zip(items, complete_times)):
+        order_id = item['order_id']
+        if complete_time is None or order_id in seen_order_ids or complete_time > now:
+            statuses[index] = INVALID
+            seen_order_ids.add(order_id)
+            continue
+        seen_order_ids.add(order_id)
+        order = orders.get(order_id)
+        if order is None or order.courier_id != item['courier_id']:
+            statuses[index] = NOT_FOUND
+        elif order.finish_date is not None:
+            statuses[index] = ALREADY_COMPLETED
+        else:
+            # orders assigned before deliveries were counted can have no delivery, they are not chained
+            key = order.delivery_id if order.delivery_id is not None else (None, order.id)
+            by_delivery.setdefault(key, []).append((complete_time, index, order))
+
+    completions = []
+    for delivery_items in by_delivery.values():
+        last_finish_at = last_finishes.get(delivery_items[0][2].delivery_id)
+        for complete_time, index, order in sorted(delivery_items, key=lambda delivery_item: delivery_item[:2]):
+            start_date = last_finish_at or order.start_date
+            if complete_time < start_date:
+                statuses[index] = INVALID
+                continue
+            statuses[index] = COMPLETED
+            completions.append((order.id, complete_time, (complete_time - start_date).total_seconds()))
+            last_finish_at = complete_time
+
+    return statuses, completions
+
+
+def save_completions(completions: [tuple]) -> None:
+    """
+    commit is up to the caller
+    :param completions: (order_id, finish_date, delivery_time) of plan_completions
+    """
+    if not completions:
+        return
+    order_ids, finish_dates, delivery_times = zip(*completions)
+    db.session.execute(
+        text(SAVE_SQL).bindparams(bindparam('order_ids', list(order_ids), type_=ARRAY(Integer)),
+                                  bindparam('finish_dates', list(finish_dates), type_=ARRAY(DateTime)),
+                                  bindparam('delivery_times', list(delivery_times), type_=ARRAY(Float)))
+    )
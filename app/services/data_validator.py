@@ -3,8 +3,18 @@ import os
 import re
 
 import jsonschema
+from sqlalchemy import ARRAY, Integer, any_, bindparam
 
-from app.models import Courier, Order
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+from app.models import Courier, Order, db
+from app.services.metrics import timed
+from app.services.util import parse_datetime
+
+TIME_REGEX = re.compile("^([01]?[0-9]|2[0-3]):[0-5][0-9]$")
 
 
 def _load_schema(schema_name: str) -> dict:
@@ -18,6 +28,42 @@ def _load_schema(schema_name: str) -> dict:
         return json.load(f)
 
 
+class CompiledValidator:
+    """
+    CompiledValidator class wraps json-schema compiled to python code by fastjsonschema
+    :arg
+        validate : function
+            raises JsonSchemaException if instance is not validated
+    """
+
+    def __init__(self, schema: dict) -> None:
+        self.validate = fastjsonschema.compile(schema)
+
+    def is_valid(self, instance) -> bool:
+        try:
+            self.validate(instance)
+        except fastjsonschema.JsonSchemaException:
+            return False
+
+        return True
+
+
+def _build_validator(schema_name: str):
+    """
+    load json-schema by name, check it once and build validator for it,
+    the schema is compiled to code if fastjsonschema is installed
+    :param schema_name:
+    :return:
+        validator instance with is_valid method
+    """
+    schema = _load_schema(schema_name)
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    if fastjsonschema is not None:
+        return CompiledValidator(schema)
+    return validator_class(schema)
+
+
 def get_error_body(entity_name: str, entity_ids: list) -> dict:
     """
     return error-body if json-body is not validated
@@ -33,6 +79,24 @@ def get_error_body(entity_name: str, entity_ids: list) -> dict:
     }
 
 
+@timed('lookup')
+def get_exists_ids(model, entity_ids: list) -> set:
+    """
+    find ids which already exist by one query
+    :param model:
+    :param entity_ids:
+    :return:
+        set of existing ids
+    """
+    if not entity_ids:
+        return set()
+    rows = db.session \
+        .query(model.id) \
+        .filter(model.id == any_(bindparam('entity_ids', entity_ids, type_=ARRAY(Integer)))) \
+        .all()
+    return {row.id for row in rows}
+
+
 def valid_time_list(time_ranges: [str]) -> bool:
     """
     validate list of time-range
@@ -57,11 +121,9 @@ def valid_time(time_range: str) -> bool:
     :return:
         time-range is validated
     """
-    regex = "^([01]?[0-9]|2[0-3]):[0-5][0-9]$"
-    p = re.compile(regex)
     if time_range == "":
         return False
-    m = re.search(p, time_range)
+    m = TIME_REGEX.search(time_range)
 
     if m is None:
         return False
@@ -71,122 +133,206 @@ def valid_time(time_range: str) -> bool:
 
 class Validator:
     """
-    Validator class used for validate json-body
+    Validator class used for validate json-body, validators of json-schemas are built once
     :arg
-        courier_path_schema
-        courier_post_schema
-        order_post_schema
-        data_schema
-        post_orders_assign_schema
-        complete_order_schema
+        courier_path_validator
+        courier_post_validator
+        order_post_validator
+        data_validator
+        post_orders_assign_validator
+        complete_order_validator
+        complete_orders_item_validator
+        entity_rules : dict
+            validator, id field and time-ranges field of entities of post-requests by entity name
     """
     def __init__(self) -> None:
-        self.courier_path_schema = _load_schema("courier_path_schema.json")
-        self.courier_post_schema = _load_schema("courier_post_schema.json")
-        self.order_post_schema = _load_schema("order_post_schema.json")
-        self.data_schema = _load_schema("data_schema.json")
-        self.post_orders_assign_schema = _load_schema("orders_assign_schema.json")
-        self.complete_order_schema = _load_schema("complete_order_schema.json")
+        self.courier_path_validator = _build_validator("courier_path_schema.json")
+        self.courier_post_validator = _build_validator("courier_post_schema.json")
+        self.order_post_validator = _build_validator("order_post_schema.json")
+        self.data_validator = _build_validator("data_schema.json")
+        self.post_orders_assign_validator = _build_validator("orders_assign_schema.json")
+        self.complete_order_validator = _build_validator("complete_order_schema.json")
+        self.complete_orders_item_validator = _build_validator("complete_orders_item_schema.json")
+        self.entity_rules = {
+            'couriers': (self.courier_post_validator, 'courier_id', 'working_hours'),
+            'orders': (self.order_post_validator, 'order_id', 'delivery_hours')
+        }
 
+    @timed('validation')
     def validate_post_courier(self, instance):
         """
         validate json-body of post-request '/couriers'
         :param instance: json-body
         :return: True if json-body is validated, or False with error-body
         """
-        try:
-            jsonschema.validate(instance=instance, schema=self.data_schema)
-        except jsonschema.exceptions.ValidationError:
+        if not self.data_validator.is_valid(instance):
+            return False,
+        error_entity_ids = self.validate_courier_entities(instance['data'])
+        if error_entity_ids is None:
             return False,
-        error_entity_ids = []
-        for entity in instance['data']:
-            try:
-                jsonschema.validate(instance=entity, schema=self.courier_post_schema)
-            except jsonschema.exceptions.ValidationError:
-                if 'courier_id' not in entity:
-                    return False,
-                error_entity_ids.append({'id': entity['courier_id']})
-                continue
-            entity_id = entity['courier_id']
-            exists_entity = Courier.query.filter_by(id=entity_id).first()
-            if exists_entity:
-                error_entity_ids.append({'id': entity_id})
-                continue
-            if not valid_time_list(entity['working_hours']):
-                error_entity_ids.append({'id': entity_id})
-
         if error_entity_ids:
             return False, get_error_body('couriers', error_entity_ids)
 
         return True,
 
+    @timed('validation')
     def validate_post_order(self, instance):
         """
         validate json-body of post-request '/orders'
         :param instance: json-body
         :return: True if json-body is validated, or False with error-body
         """
-        try:
-            jsonschema.validate(instance=instance, schema=self.data_schema)
-        except jsonschema.exceptions.ValidationError:
+        if not self.data_validator.is_valid(instance):
             return False,
-        error_entity_ids = []
-        for entity in instance['data']:
-            try:
-                jsonschema.validate(instance=entity, schema=self.order_post_schema)
-            except jsonschema.exceptions.ValidationError:
-                if 'order_id' not in entity:
-                    return False,
-                error_entity_ids.append({'id': entity['order_id']})
+        error_entity_ids = self.validate_order_entities(instance['data'])
+        if error_entity_ids is None:
+            return False,
+        if error_entity_ids:
+            return False, get_error_body('orders', error_entity_ids)
+
+        return True,
+
+    @timed('validation')
+    def validate_courier_entities(self, entities: list, seen_entity_ids: set = None):
+        """
+        validate couriers of post-request '/couriers'
+        :param entities: couriers
+        :param seen_entity_ids: ids of previous couriers of the same request which are not saved yet
+        :return: list of error ids, or None if some courier has no id
+        """
+        return self._validate_entities('couriers', entities, Courier, seen_entity_ids)
+
+    @timed('validation')
+    def validate_order_entities(self, entities: list, seen_entity_ids: set = None):
+        """
+        validate orders of post-request '/orders'
+        :param entities: orders
+        :param seen_entity_ids: ids of previous orders of the same request which are not saved yet
+        :return: list of error ids, or None if some order has no id
+        """
+        return self._validate_entities('orders', entities, Order, seen_entity_ids)
+
+    def _validate_entities(self, entity_name: str, entities: list, model, seen_entity_ids: set = None):
+        """
+        validate entities by schema and time-ranges, existing ids are checked by one query
+        :param entity_name: 'couriers' or 'orders'
+        :param entities:
+        :param model: model of entity
+        :param seen_entity_ids: ids of previous entities which are not saved yet, updated in place
+        :return: list of error ids, or None if some entity has no id
+        """
+        checked = self.check_entities(entity_name, entities)
+        if checked is None:
+            return None
+        invalid_indexes, entity_ids = checked
+        exists_entity_ids = get_exists_ids(model, entity_ids)
+
+        return self.get_error_ids(entity_name, entities, invalid_indexes, exists_entity_ids, seen_entity_ids)
+
+    def check_entities(self, entity_name: str, entities: list):
+        """
+        first step of validation of entities which does not need the database
+        :param entity_name: 'couriers' or 'orders'
+        :param entities:
+        :return: indexes of entities which are not validated by schema and ids of other entities,
+            or None if some entity has no id
+        """
+        validator, id_field, _ = self.entity_rules[entity_name]
+        invalid_indexes = set()
+        entity_ids = []
+        for index, entity in enumerate(entities):
+            if not validator.is_valid(entity):
+                if not isinstance(entity, dict) or id_field not in entity:
+                    return None
+                invalid_indexes.add(index)
                 continue
-            entity_id = entity['order_id']
-            exists_entity = Order.query.filter_by(id=entity_id).first()
-            if exists_entity:
+            entity_ids.append(entity[id_field])
+
+        return invalid_indexes, entity_ids
+
+    def get_error_ids(self, entity_name: str, entities: list, invalid_indexes: set, exists_entity_ids: set,
+                      seen_entity_ids: set = None) -> list:
+        """
+        second step of validation of entities, after existing ids are found in the database
+        :param entity_name: 'couriers' or 'orders'
+        :param entities:
+        :param invalid_indexes: indexes of entities which are not validated by schema
+        :param exists_entity_ids: ids which already exist
+        :param seen_entity_ids: ids of previous entities which are not saved yet, updated in place
+        :return: list of error ids
+        """
+        _, id_field, hours_field = self.entity_rules[entity_name]
+        if seen_entity_ids is None:
+            seen_entity_ids = set()
+        error_entity_ids = []
+        for index, entity in enumerate(entities):
+            entity_id = entity[id_field]
+            if index in invalid_indexes:
                 error_entity_ids.append({'id': entity_id})
                 continue
-            if not valid_time_list(entity['delivery_hours']):
+            if entity_id in exists_entity_ids \
+                    or entity_id in seen_entity_ids \
+                    or not valid_time_list(entity[hours_field]):
                 error_entity_ids.append({'id': entity_id})
+            seen_entity_ids.add(entity_id)
 
-        if error_entity_ids:
-            return False, get_error_body('orders', error_entity_ids)
-
-        return True,
+        return error_entity_ids
 
+    @timed('validation')
     def validate_path_courier(self, instance):
         """
         validate json-body of path-request '/couriers/$courier_id'
         :param instance: json-body
         :return: True if json-body is validated, or False
         """
-        try:
-            jsonschema.validate(instance=instance, schema=self.courier_path_schema)
-        except jsonschema.exceptions.ValidationError:
+        if not self.courier_path_validator.is_valid(instance):
+            return False
+        if 'working_hours' in instance and not valid_time_list(instance['working_hours']):
             return False
 
         return True
 
+    @timed('validation')
     def validate_post_orders_assign(self, instance):
         """
         validate json-body of post-request '/order/assign'
         :param instance: json-body
         :return: True if json-body is validated, or False
         """
-        try:
-            jsonschema.validate(instance=instance, schema=self.post_orders_assign_schema)
-        except jsonschema.exceptions.ValidationError:
+        if not self.post_orders_assign_validator.is_valid(instance):
             return False
 
         return True
 
+    @timed('validation')
     def validate_complete_order(self, instance):
         """
         validate json-body of post-request '/order/complete'
         :param instance: json-body
         :return: True if json-body is validated, or False
         """
-        try:
-            jsonschema.validate(instance=instance, schema=self.complete_order_schema)
-        except jsonschema.exceptions.ValidationError:
+        if not self.complete_order_validator.is_valid(instance):
             return False
 
         return True
+
+    @timed('validation')
+    def validate_complete_orders(self, instance):
+        """
+        validate json-body of post-request '/orders/complete/batch', items are validated one by one
+        :param instance: json-body
+        :return: parsed complete_time of every item or None for items which are not validated,
+            None if json-body is not validated or some item has no order_id
+        """
+        if not self.data_validator.is_valid(instance):
+            return None
+        complete_times = []
+        for item in instance['data']:
+            if not self.complete_orders_item_validator.is_valid(item):
+                if not isinstance(item, dict) or type(item.get('order_id')) is not int:
+                    return None
+                complete_times.append(None)
+                continue
+            complete_times.append(parse_datetime(item['complete_time']))
+
+        return complete_times
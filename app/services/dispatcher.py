@@ -0,0 +1,316 @@
+"""
+batch dispatcher plans the whole backlog of unassigned orders for all couriers at once,
+/orders/assign claims orders planned for the courier instead of searching the backlog
+"""
+import multiprocessing
+import os
+import time
+
+try:
+    import numpy as nm
+except ImportError:
+    nm = None
+
+from flask import current_app
+from psycopg2.extras import execute_values
+from sqlalchemy import func, text
+
+from app.models import ACTIVE_PERIOD, Courier, Order, db
+from app.services import util
+
+DISPATCH_INTERVAL = float(os.environ.get('DISPATCH_INTERVAL', 5))
+DISPATCH_PROCESSES = int(os.environ.get('DISPATCH_PROCESSES', 1))
+DISPATCH_BATCH_SIZE = int(os.environ.get('DISPATCH_BATCH_SIZE', 1000))
+# max size of one boolean matrix of windows of orders and couriers
+DISPATCH_MATCH_CELLS = 1 << 22
+# key of the advisory lock, only one dispatcher plans at a time
+DISPATCH_LOCK_KEY = 1907
+
+SAVE_PLAN_SQL = """UPDATE orders SET planned_courier_id = plan.courier_id
+FROM (VALUES %s) AS plan(order_id, courier_id)
+WHERE orders.id = plan.order_id AND orders.completed_period = 0
+AND orders.courier_id IS NULL AND orders.start_date IS NULL"""
+
+
+class RegionComponents:
+    """
+    RegionComponents class joins regions served by the same courier (union-find),
+    couriers and orders of different components never compete, so components are planned independently
+    """
+
+    def __init__(self) -> None:
+        self._parents = {}
+
+    def find(self, region: int) -> int:
+        root = self._parents.setdefault(region, region)
+        while root != self._parents[root]:
+            root = self._parents[root]
+        while region != root:
+            self._parents[region], region = root, self._parents[region]
+        return root
+
+    def union(self, regions: [int]) -> None:
+        if not regions:
+            return
+        root = self.find(regions[0])
+        for region in regions[1:]:
+            self._parents[self.find(region)] = root
+
+    def get_roots(self) -> dict:
+        """
+        :return: root region of the component by region
+        """
+        return {region: self.find(region) for region in list(self._parents)}
+
+
+def load_couriers() -> [tuple]:
+    """
+    :return: (id, free capacity, regions, working_intervals) of couriers which can take orders
+    """
+    assigned_weight = db.session \
+        .query(Order.courier_id, func.sum(Order.weight).label('weight')) \
+        .filter(Order.courier_id.isnot(None),
+                Order.completed_period == ACTIVE_PERIOD,
+                Order.start_date.isnot(None),
+                Order.finish_date.is_(None)) \
+        .group_by(Order.courier_id) \
+        .subquery()
+    rows = db.session \
+        .query(Courier.id,
+               Courier.courier_type,
+               Courier.regions,
+               Courier.working_hours,
+               Courier.working_intervals,
+               func.coalesce(assigned_weight.c.weight, 0)) \
+        .outerjoin(assigned_weight, assigned_weight.c.courier_id == Courier.id) \
+        .order_by(Courier.id) \
+        .all()
+
+    couriers = []
+    for courier_id, courier_type, regions, working_hours, working_intervals, weight in rows:
+        free = util.get_weight_by_type(courier_type) - weight
+        if free > 0 and regions:
+            if working_intervals is None:
+                intervals = util.compile_time_ranges(working_hours)
+            else:
+                intervals = util.split_intervals(working_intervals)
+            couriers.append((courier_id, free, regions, intervals))
+    return couriers
+
+
+def load_orders() -> [tuple]:
+    """
+    :return: (id, weight, region, delivery_intervals, planned_courier_id) of unassigned orders
+    """
+    return [tuple(row) for row in db.session
+            .query(Order.id, Order.weight, Order.region, Order.delivery_intervals, Order.planned_courier_id)
+            .filter(Order.courier_id.is_(None),
+                    Order.completed_period == ACTIVE_PERIOD,
+                    Order.start_date.is_(None),
+                    Order.finish_date.is_(None))
+            .order_by(Order.id)
+            .all()]
+
+
+def split_by_regions(couriers: [tuple], orders: [tuple]) -> [tuple]:
+    """
+    :param couriers: rows of load_couriers
+    :param orders: rows of load_orders
+    :return: (couriers, orders) of every component, the largest first,
+        orders of regions without couriers are left out
+    """
+    components = RegionComponents()
+    for courier in couriers:
+        components.union(courier[2])
+
+    roots = components.get_roots()
+    parts = {}
+    for courier in couriers:
+        parts.setdefault(roots[courier[2][0]], ([], []))[0].append(courier)
+    for order in orders:
+        root = roots.get(order[2])
+        if root is not None:
+            parts[root][1].append(order)
+
+    return sorted((part for part in parts.values() if part[1]), key=lambda part: len(part[1]), reverse=True)
+
+
+def plan_component(part: tuple) -> [tuple]:
+    """
+    best fit decreasing over all couriers: from the heaviest order, every order goes to the courier
+    which has the least free capacity left after taking it, so light orders fill the gaps of loaded couriers
+    :param part: couriers and orders of one component
+    :return: (order_id, courier_id) of planned orders
+    """
+    couriers, orders = part
+    couriers_by_region = {}
+    for index, courier in enumerate(couriers):
+        for region in courier[2]:
+            couriers_by_region.setdefault(region, []).append(index)
+    if nm is not None:
+        candidates = _match_numpy(couriers, orders, couriers_by_region)
+    else:
+        candidates = _match_python(couriers, orders, couriers_by_region)
+
+    free = [int(round(courier[1] * 100)) for courier in couriers]
+    plan = []
+    for index in sorted(range(len(orders)), key=lambda i: -orders[i][1]):
+        unit = int(round(orders[index][1] * 100))
+        chosen = None
+        for courier_index in candidates[index]:
+            if unit <= free[courier_index] and (chosen is None or free[courier_index] < free[chosen]):
+                chosen = courier_index
+        if chosen is not None:
+            free[chosen] -= unit
+            plan.append((orders[index][0], couriers[chosen][0]))
+
+    return plan
+
+
+def _match_numpy(couriers: [tuple], orders: [tuple], couriers_by_region: dict) -> [[int]]:
+    """
+    time windows of all orders of a region are compared with all couriers of the region in one vectorized pass,
+    windows which cross midnight are split like in assignment.RANGES_FIT_SQL
+    :return: indexes of couriers of the order`s region which can deliver it in time, for every order
+    """
+    width = max(len(courier[3]) // 2 for courier in couriers) or 1
+    # windows are padded by empty ranges which contain nothing
+    starts = nm.ones((len(couriers), width), dtype=nm.int32)
+    finishes = nm.zeros((len(couriers), width), dtype=nm.int32)
+    for index, courier in enumerate(couriers):
+        count = len(courier[3]) // 2
+        starts[index, :count] = courier[3][0::2]
+        finishes[index, :count] = courier[3][1::2]
+
+    windows_by_region = {}
+    for index, (_, _, region, intervals, _) in enumerate(orders):
+        windows = windows_by_region.setdefault(region, ([], [], []))
+        intervals = util.split_intervals(intervals)
+        for i in range(0, len(intervals), 2):
+            windows[0].append(index)
+            windows[1].append(intervals[i])
+            windows[2].append(intervals[i + 1])
+
+    candidates = [[] for _ in orders]
+    for region, (window_orders, window_starts, window_finishes) in windows_by_region.items():
+        region_couriers = nm.array(couriers_by_region[region], dtype=nm.int64)
+        region_starts = starts[region_couriers]
+        region_finishes = finishes[region_couriers]
+        window_starts = nm.array(window_starts, dtype=nm.int32)[:, None, None]
+        window_finishes = nm.array(window_finishes, dtype=nm.int32)[:, None, None]
+        # windows of one order are adjacent, offsets are the first window of every order
+        region_orders, offsets = nm.unique(nm.array(window_orders, dtype=nm.int64), return_index=True)
+        offsets = offsets.tolist() + [len(window_orders)]
+        step = max(1, DISPATCH_MATCH_CELLS // region_starts.size)
+        for i in range(0, len(region_orders), step):
+            j = min(i + step, len(region_orders))
+            first, last = offsets[i], offsets[j]
+            fits = ((region_starts <= window_starts[first:last]) & (region_finishes >= window_finishes[first:last])) \
+                .any(axis=2)
+            fits = nm.logical_or.reduceat(fits, nm.array(offsets[i:j], dtype=nm.int64) - first, axis=0)
+            rows, columns = nm.nonzero(fits)
+            for order_index, courier_index in zip(region_orders[i + rows].tolist(), region_couriers[columns].tolist()):
+                candidates[order_index].append(courier_index)
+
+    return candidates
+
+
+def _match_python(couriers: [tuple], orders: [tuple], couriers_by_region: dict) -> [[int]]:
+    """
+    pure-python fallback of _match_numpy
+    """
+    candidates = []
+    for _, _, region, intervals, _ in orders:
+        intervals = util.split_intervals(intervals)
+        windows = [(intervals[i], intervals[i + 1]) for i in range(0, len(intervals), 2)]
+        candidates.append([index for index in couriers_by_region[region]
+                           if any(couriers[index][3][j] <= start and finish <= couriers[index][3][j + 1]
+                                  for start, finish in windows for j in range(0, len(couriers[index][3]), 2))])
+    return candidates
+
+
+def make_plan(couriers: [tuple], orders: [tuple], pool=None) -> dict:
+    """
+    :param couriers: rows of load_couriers
+    :param orders: rows of load_orders
+    :param pool: multiprocessing pool which plans components in parallel, or None
+    :return: courier id by order id
+    """
+    parts = split_by_regions(couriers, orders)
+    if pool is not None and len(parts) > 1:
+        plans = pool.imap_unordered(plan_component, parts)
+    else:
+        plans = map(plan_component, parts)
+
+    result = {}
+    for plan in plans:
+        result.update(plan)
+    return result
+
+
+def save_plan(orders: [tuple], plan: dict, batch_size: int = DISPATCH_BATCH_SIZE) -> int:
+    """
+    write planned couriers which changed since the previous plan, commit is up to the caller
+    :param orders: rows of load_orders
+    :param plan: courier id by order id
+    :param batch_size: count of rows in one statement
+    :return: count of changed orders
+    """
+    changes = [(order[0], plan.get(order[0])) for order in orders if order[4] != plan.get(order[0])]
+    if not changes:
+        return 0
+    cursor = db.session.connection().connection.cursor()
+    try:
+        execute_values(cursor, SAVE_PLAN_SQL, changes, template='(%s, %s::integer)', page_size=batch_size)
+    finally:
+        cursor.close()
+    return len(changes)
+
+
+def dispatch(pool=None) -> dict:
+    """
+    plan the backlog in one transaction, rows are locked only by the final update
+    :param pool: multiprocessing pool, or None
+    :return: statistic of the tick, or None if other dispatcher holds the lock
+    """
+    started = time.perf_counter()
+    if not db.session.execute(text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': DISPATCH_LOCK_KEY}).scalar():
+        db.session.rollback()
+        return None
+    couriers = load_couriers()
+    orders = load_orders()
+    plan = make_plan(couriers, orders, pool)
+    changed = save_plan(orders, plan)
+    db.session.commit()
+
+    return {
+        'couriers': len(couriers),
+        'orders': len(orders),
+        'planned': len(plan),
+        'changed': changed,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def run(interval: float = DISPATCH_INTERVAL, processes: int = DISPATCH_PROCESSES, once: bool = False) -> None:
+    """
+    plan the backlog every interval seconds, needs the application context for the log
+    :param interval: seconds between starts of ticks
+    :param processes: count of processes which plan components, 1 plans in the current process
+    :param once: plan once and return
+    """
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        while True:
+            started = time.monotonic()
+            stats = dispatch(pool)
+            if stats is not None:
+                current_app.logger.info('plan %s', stats)
+            else:
+                current_app.logger.debug('plan is locked by other dispatcher')
+            if once:
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        if pool is not None:
+            pool.terminate()
@@ -0,0 +1,95 @@
+import os
+
+try:
+    import numpy as nm
+except ImportError:
+    nm = None
+
+ASSIGN_CLAIM_ATTEMPTS = int(os.environ.get('ASSIGN_CLAIM_ATTEMPTS', 3))
+
+
+class OrderBatch:
+    """
+    OrderBatch class holds candidate orders in columnar form
+    :arg
+        ids : order ids
+        weights : order weights
+    """
+
+    def __init__(self, rows: [tuple], use_numpy: bool = True) -> None:
+        self.use_numpy = use_numpy and nm is not None
+        ids = [row[0] for row in rows]
+        weights = [row[1] for row in rows]
+        if self.use_numpy:
+            self.ids = nm.array(ids, dtype=nm.int64)
+            self.weights = nm.array(weights, dtype=nm.float64)
+        else:
+            self.ids = ids
+            self.weights = weights
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get_weights(self, indexes: [int]):
+        """
+        :param indexes:
+        :return: weights of orders by indexes
+        """
+        if self.use_numpy:
+            return self.weights[nm.asarray(indexes, dtype=nm.int64)]
+        return [self.weights[index] for index in indexes]
+
+
+class OrderClaim:
+    """
+    OrderClaim class chooses orders by strategy until all chosen orders are locked,
+    orders locked or taken by concurrent requests are dropped and the choice is repeated without them
+    :arg
+        batch : OrderBatch
+            candidate orders
+        matched : list
+            indexes of orders in batch which courier can accept
+        weight : float
+            free capacity of courier
+        strategy : function
+            choose orders which fit into free capacity of courier
+        attempts : int
+            max count of choices
+        order_ids : list
+            ids of locked orders
+    """
+
+    def __init__(self, batch: OrderBatch, matched: [int], weight: float, strategy, attempts: int) -> None:
+        self.batch = batch
+        self.matched = matched
+        self.weight = weight
+        self.strategy = strategy
+        self.attempts = attempts
+        self.order_ids = []
+        self._chosen = []
+
+    def choose(self) -> [int]:
+        """
+        :return: ids of orders to lock, empty list if choice is finished
+        """
+        if self.attempts <= 0:
+            return []
+        self.attempts -= 1
+        chosen = self.strategy(self.batch.get_weights(self.matched), self.weight)
+        self._chosen = [self.matched[index] for index in chosen]
+        return [int(self.batch.ids[index]) for index in self._chosen]
+
+    def claimed(self, claimed_ids: set) -> None:
+        """
+        :param claimed_ids: ids of chosen orders which are locked
+        """
+        for index in self._chosen:
+            if int(self.batch.ids[index]) in claimed_ids:
+                self.order_ids.append(int(self.batch.ids[index]))
+                self.weight -= float(self.batch.weights[index])
+        if len(claimed_ids) == len(self._chosen):
+            self.attempts = 0
+            return
+        chosen = set(self._chosen)
+        self.matched = [index for index in self.matched
+                        if index not in chosen and self.batch.weights[index] <= self.weight]
@@ -0,0 +1,295 @@
+"""
+per-request metrics of the flask application in prometheus text format,
+metrics are kept by every worker process like the statistic of the connection pool
+"""
+import functools
+import os
+import threading
+import time
+
+import flask
+from flask import g, request
+from sqlalchemy import event
+
+METRICS_ENABLED = os.environ.get('METRICS', 'on') != 'off'
+# requests longer than SLOW_REQUEST_MS are logged with their statements, 0 disables the log
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+SLOW_REQUEST_STATEMENTS = 50
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500, 1000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Counter class is a prometheus counter with labels
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> [str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in values]
+
+
+class Histogram:
+    """
+    Histogram class is a prometheus histogram with labels and cumulative buckets
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # counts of buckets, +Inf, sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def collect(self) -> [str]:
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        lines = []
+        for labels, counts in values:
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                le = f'le="{bound if bound == "+Inf" else _format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {counts[-2]}')
+        return lines
+
+
+class Registry:
+    """
+    Registry class renders metrics in prometheus text format
+    """
+
+    def __init__(self) -> None:
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, gauges: dict = None) -> str:
+        """
+        :param gauges: values of gauges without labels by name, they are read by the caller
+        :return: text of all metrics
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.collect())
+        for name, value in (gauges or {}).items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+ENDPOINT_LABELS = ('method', 'endpoint')
+REQUESTS = REGISTRY.add(Counter(
+    'http_requests_total', 'count of requests', ENDPOINT_LABELS + ('status',)))
+REQUEST_SECONDS = REGISTRY.add(Histogram(
+    'http_request_duration_seconds', 'latency of requests until the response body is returned', ENDPOINT_LABELS))
+DB_STATEMENTS = REGISTRY.add(Histogram(
+    'http_request_db_statements', 'count of sql statements of a request', ENDPOINT_LABELS, STATEMENT_BUCKETS))
+REPEATED_STATEMENTS = REGISTRY.add(Counter(
+    'http_request_repeated_statements_total',
+    'executions of a sql statement which was already executed by the same request, N+1 queries', ENDPOINT_LABELS))
+DB_SECONDS = REGISTRY.add(Histogram(
+    'http_request_db_seconds', 'time of sql statements of a request', ENDPOINT_LABELS))
+PHASE_SECONDS = REGISTRY.add(Histogram(
+    'http_request_phase_seconds', 'time of validation, lookup and serialization of a request',
+    ENDPOINT_LABELS + ('phase',)))
+SLOW_REQUESTS = REGISTRY.add(Counter(
+    'http_slow_requests_total', 'count of requests longer than SLOW_REQUEST_MS', ENDPOINT_LABELS))
+
+
+class RequestStats:
+    """
+    RequestStats class collects time of one request by phases and its sql statements
+    :arg
+        statements : int
+            count of sql statements
+        statement_counts : dict
+            count of executions by text of sql statement
+        db_seconds : float
+        phases : dict
+            seconds by phase, time of a phase nested in other phase is not counted in the outer one
+        queries : list
+            (statement, seconds) of the first statements, only if the slow log is on
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.statement_counts = {}
+        self.db_seconds = 0.0
+        self.phases = {}
+        self.active_phases = set()
+        self.queries = []
+
+    def add_statement(self, statement: str, seconds: float) -> None:
+        self.statements += 1
+        self.statement_counts[statement] = self.statement_counts.get(statement, 0) + 1
+        self.db_seconds += seconds
+        if SLOW_REQUEST_MS and len(self.queries) < SLOW_REQUEST_STATEMENTS:
+            self.queries.append((statement, seconds))
+
+
+def _get_request_stats():
+    if not flask.has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+def timed(phase: str):
+    """
+    decorator which adds time of the function to the phase of the current request,
+    nested calls of the same phase are counted once, time of a nested phase is subtracted from outer phases
+    :param phase: 'validation', 'lookup' or 'serialization'
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stats = _get_request_stats()
+            if stats is None or phase in stats.active_phases:
+                return function(*args, **kwargs)
+            outer_phases = list(stats.active_phases)
+            stats.active_phases.add(phase)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                stats.phases[phase] = stats.phases.get(phase, 0.0) + seconds
+                for outer_phase in outer_phases:
+                    stats.phases[outer_phase] = stats.phases.get(outer_phase, 0.0) - seconds
+                stats.active_phases.discard(phase)
+        return wrapper
+    return decorator
+
+
+def instrument_engine(engine) -> None:
+    """
+    count sql statements of requests and their time, statements of raw cursors like bulk inserts are not seen
+    :param engine:
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('statement_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info['statement_started'].pop()
+        stats = _get_request_stats()
+        if stats is not None:
+            stats.add_statement(statement, seconds)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('statement_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def instrument_app(app: flask.Flask) -> None:
+    """
+    record metrics of every request of the application
+    :param app:
+    """
+    @app.before_request
+    def start_request():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def save_status(response):
+        g.response_status = response.status_code
+        return response
+
+    # teardown is called after unhandled exceptions too, after_request is not
+    @app.teardown_request
+    def finish_request(exception):
+        stats = g.pop('request_stats', None)
+        if stats is not None:
+            observe_request(stats, 500 if exception is not None else g.pop('response_status', 500))
+
+
+def observe_request(stats: RequestStats, status: int) -> None:
+    seconds = time.perf_counter() - stats.started
+    labels = (request.method, request.url_rule.rule if request.url_rule is not None else 'unmatched')
+    REQUESTS.inc(labels + (str(status),))
+    REQUEST_SECONDS.observe(labels, seconds)
+    DB_STATEMENTS.observe(labels, stats.statements)
+    DB_SECONDS.observe(labels, stats.db_seconds)
+    repeated = stats.statements - len(stats.statement_counts)
+    if repeated:
+        REPEATED_STATEMENTS.inc(labels, repeated)
+    for phase, phase_seconds in stats.phases.items():
+        PHASE_SECONDS.observe(labels + (phase,), phase_seconds)
+
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(labels)
+        flask.current_app.logger.warning(format_slow_request(stats, seconds, status))
+
+
+def format_slow_request(stats: RequestStats, seconds: float, status: int) -> str:
+    """
+    :return: log record with phases and statements of the request, repeated statements are grouped on top
+    """
+    phases = ', '.join(f'{phase} {phase_seconds * 1000:.1f} ms' for phase, phase_seconds in stats.phases.items())
+    lines = [f'slow request {request.method} {request.full_path.rstrip("?")} {status} {seconds * 1000:.1f} ms, '
+             f'{stats.statements} statements {stats.db_seconds * 1000:.1f} ms' + (f', {phases}' if phases else '')]
+    for statement, count in sorted(stats.statement_counts.items(), key=lambda item: -item[1]):
+        if count > 1:
+            lines.append(f'  repeated {count} times: {" ".join(statement.split())[:300]}')
+    for statement, statement_seconds in stats.queries:
+        lines.append(f'  {statement_seconds * 1000:8.2f} ms  {" ".join(statement.split())[:300]}')
+    if stats.statements > len(stats.queries):
+        lines.append(f'  ... {stats.statements - len(stats.queries)} statements more')
+    return '\n'.join(lines)
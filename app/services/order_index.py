@@ -0,0 +1,258 @@
+"""
+in-process index of unassigned orders, candidate orders of a courier are found without a query to the table.
+The index is per process and is meant for a single worker: other processes do not update it,
+so an order which is taken by other process and is still in the index is skipped by the claim
+of assignment.assign_orders and evicted, the index is rebuilt from the database periodically
+"""
+import bisect
+import os
+import threading
+import time
+
+from flask import current_app
+
+from app.models import ACTIVE_PERIOD, Order, db
+from app.services import util
+
+ORDER_INDEX_REFRESH = float(os.environ.get('ORDER_INDEX_REFRESH', 60))
+
+
+def compile_windows(intervals: [int]) -> tuple:
+    """
+    :param intervals: compiled delivery-hours
+    :return: intervals where windows which cross midnight are split like in assignment.RANGES_FIT_SQL
+    """
+    return tuple(util.split_intervals(intervals))
+
+
+def to_order_tuple(row: dict) -> tuple:
+    """
+    :param row: values of orders columns like util.get_order_row
+    :return: (id, weight, region, delivery_intervals)
+    """
+    return row['id'], row['weight'], row['region'], row['delivery_intervals']
+
+
+def get_order_keys(region: int, windows: tuple) -> set:
+    """
+    :param windows: split delivery-hours of order
+    :return: keys of buckets of order: region and hour of start of every window
+    """
+    return {(region, windows[i] // 60) for i in range(0, len(windows), 2)}
+
+
+def get_courier_keys(regions: [int], courier_intervals: [int]) -> set:
+    """
+    an order window fits into a courier`s interval only if it starts inside it,
+    so only buckets of hours of courier`s intervals can have candidates
+    :param courier_intervals: split working-hours of courier
+    :return: keys of buckets of courier`s candidates
+    """
+    return {(region, hour)
+            for region in set(regions)
+            for i in range(0, len(courier_intervals), 2)
+            for hour in range(courier_intervals[i] // 60, courier_intervals[i + 1] // 60 + 1)}
+
+
+class OrderBucket:
+    """
+    OrderBucket class keeps orders of one region whose windows start in one hour sorted by weight
+    """
+    __slots__ = ('weights', 'orders')
+
+    def __init__(self) -> None:
+        self.weights = []
+        self.orders = []
+
+    def add(self, order: tuple, weight: float) -> None:
+        position = bisect.bisect_right(self.weights, weight)
+        self.weights.insert(position, weight)
+        self.orders.insert(position, order)
+
+    def remove(self, order_id: int, weight: float) -> None:
+        for position in range(bisect.bisect_left(self.weights, weight), bisect.bisect_right(self.weights, weight)):
+            if self.orders[position][0] == order_id:
+                del self.weights[position]
+                del self.orders[position]
+                return
+
+    def get_lighter(self, weight: float) -> [tuple]:
+        """
+        :return: orders with weight not greater than weight
+        """
+        return self.orders[:bisect.bisect_right(self.weights, weight)]
+
+
+class OrderIndex:
+    """
+    OrderIndex class holds unassigned orders of the database bucketed by region and hour of start of windows,
+    it is built on first use and rebuilt every refresh seconds in a background thread
+    :arg
+        refresh : float
+            seconds between rebuilds, 0 disables rebuilds
+        built_at : float
+            time.monotonic() of the last build, or None
+    """
+
+    def __init__(self, refresh: float = ORDER_INDEX_REFRESH) -> None:
+        self.refresh = refresh
+        self.built_at = None
+        self._orders = {}
+        self._buckets = {}
+        # changes made while the index is rebuilt, they are applied to the new index
+        self._journal = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._refresher = None
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    @staticmethod
+    def _add(orders: dict, buckets: dict, rows: [tuple]) -> None:
+        for order_id, weight, region, intervals in rows:
+            if order_id in orders:
+                continue
+            order = (order_id, weight, region, compile_windows(intervals))
+            orders[order_id] = order
+            for key in get_order_keys(region, order[3]):
+                buckets.setdefault(key, OrderBucket()).add(order, weight)
+
+    @staticmethod
+    def _remove(orders: dict, buckets: dict, order_ids: [int]) -> None:
+        for order_id in order_ids:
+            order = orders.pop(order_id, None)
+            if order is None:
+                continue
+            for key in get_order_keys(order[2], order[3]):
+                bucket = buckets[key]
+                bucket.remove(order_id, order[1])
+                if not bucket.weights:
+                    del buckets[key]
+
+    def add(self, rows: [tuple]) -> None:
+        """
+        add orders which became unassigned, after commit
+        :param rows: (id, weight, region, delivery_intervals)
+        """
+        with self._lock:
+            self._add(self._orders, self._buckets, rows)
+            if self._journal is not None:
+                self._journal.append((self._add, rows))
+
+    def remove(self, order_ids: [int]) -> None:
+        """
+        remove orders which were assigned, after commit
+        :param order_ids:
+        """
+        with self._lock:
+            self._remove(self._orders, self._buckets, order_ids)
+            if self._journal is not None:
+                self._journal.append((self._remove, order_ids))
+
+    def rebuild(self) -> None:
+        """
+        load unassigned orders from the database in the session transaction, the index is replaced at once
+        """
+        with self._build_lock:
+            with self._lock:
+                self._journal = []
+            try:
+                orders, buckets = {}, {}
+                self._add(orders, buckets, _load_unassigned_orders())
+                with self._lock:
+                    for apply, rows in self._journal:
+                        apply(orders, buckets, rows)
+                    self._orders, self._buckets = orders, buckets
+                    self.built_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._journal = None
+
+    def ensure_built(self) -> None:
+        """
+        build the index on first use and start its refresher, needs the application context
+        """
+        if self.built_at is None:
+            self.rebuild()
+        if self._refresher is None and self.refresh > 0:
+            with self._build_lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh,
+                                                       args=(current_app._get_current_object(),), daemon=True)
+                    self._refresher.start()
+
+    def _refresh(self, app) -> None:
+        while True:
+            time.sleep(self.refresh)
+            with app.app_context():
+                try:
+                    self.rebuild()
+                except Exception:
+                    app.logger.exception('order index is not rebuilt')
+                finally:
+                    db.session.remove()
+
+    def get_candidate_orders(self, regions: [int], weight: float, courier_intervals: [int]) -> [tuple]:
+        """
+        the same orders as assignment.get_candidate_orders which are known to the index,
+        only orders lighter than weight are taken from buckets of courier`s regions and hours,
+        they are checked after the lock is released
+        :return: (id, weight, region, delivery_intervals) ordered by id
+        """
+        self.ensure_built()
+        courier_intervals = util.split_intervals(courier_intervals)
+        keys = get_courier_keys(regions, courier_intervals)
+        with self._lock:
+            buckets = [self._buckets.get(key) for key in keys]
+            lighter = [bucket.get_lighter(weight) for bucket in buckets if bucket is not None]
+
+        candidates = {}
+        for orders in lighter:
+            for order in orders:
+                if order[0] not in candidates and util.is_intervals_fit(courier_intervals, order[3]):
+                    candidates[order[0]] = order
+        return sorted(candidates.values())
+
+    def check(self) -> dict:
+        """
+        compare the index with the database, changes committed while checking can be counted as differences
+        :return: count of orders in the index, unassigned orders missing in the index,
+            orders in the index which are not unassigned anymore and seconds since the build
+        """
+        self.ensure_built()
+        order_ids = {row[0] for row in db.session
+                     .query(Order.id)
+                     .filter(Order.courier_id.is_(None),
+                             Order.completed_period == ACTIVE_PERIOD,
+                             Order.start_date.is_(None),
+                             Order.finish_date.is_(None))
+                     .all()}
+        with self._lock:
+            index_ids = set(self._orders)
+        return {
+            'size': len(index_ids),
+            'missing': len(order_ids - index_ids),
+            'stale': len(index_ids - order_ids),
+            'age': round(time.monotonic() - self.built_at, 3)
+        }
+
+
+def _load_unassigned_orders() -> [tuple]:
+    return db.session \
+        .query(Order.id, Order.weight, Order.region, Order.delivery_intervals) \
+        .filter(Order.courier_id.is_(None),
+                Order.completed_period == ACTIVE_PERIOD,
+                Order.start_date.is_(None),
+                Order.finish_date.is_(None)) \
+        .all()
+
+
+def get_order_index():
+    """
+    index of unassigned orders by environment variable ORDER_INDEX: memory or off
+    :return: OrderIndex or None
+    """
+    if os.environ.get('ORDER_INDEX', 'off') == 'memory':
+        return OrderIndex()
+    return None
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """
+    TimedQueuePool class is QueuePool which records how long requests wait for a connection,
+    statistic is shared by pools of the process because the engine recreates its pool on dispose
+    """
+    _lock = threading.Lock()
+    checkouts = 0
+    timeouts = 0
+    wait_seconds_total = 0.0
+    wait_seconds_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with TimedQueuePool._lock:
+                TimedQueuePool.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with TimedQueuePool._lock:
+                TimedQueuePool.checkouts += 1
+                TimedQueuePool.wait_seconds_total += waited
+                TimedQueuePool.wait_seconds_max = max(TimedQueuePool.wait_seconds_max, waited)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).lower() == 'true'
+
+
+def is_pgbouncer_mode() -> bool:
+    """
+    :return: True if the database is behind PgBouncer in transaction pooling mode
+    """
+    return _env_flag('DB_PGBOUNCER', 'false')
+
+
+def get_statement_timeout() -> int:
+    """
+    :return: statement timeout in milliseconds, 0 is no timeout
+    """
+    return int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+
+
+def get_engine_options() -> dict:
+    """
+    options of create_engine from environment variables
+    :return: SQLALCHEMY_ENGINE_OPTIONS
+    """
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', 'true')
+    }
+    statement_timeout = get_statement_timeout()
+    if statement_timeout and not is_pgbouncer_mode():
+        # PgBouncer rejects startup parameters, so there the timeout is set per transaction
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+
+    return options
+
+
+def configure_engine(engine) -> None:
+    """
+    set session state per transaction in PgBouncer mode,
+    a server connection is only owned by the client for one transaction there
+    :param engine:
+    """
+    statement_timeout = get_statement_timeout()
+    if not (statement_timeout and is_pgbouncer_mode()):
+        return
+
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(connection):
+        connection.execute(f'SET LOCAL statement_timeout = {statement_timeout}')
+
+
+def get_pool_metrics(engine) -> dict:
+    """
+    :param engine:
+    :return: state of connection pool of the engine and wait statistic
+    """
+    pool = engine.pool
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'checkouts': TimedQueuePool.checkouts,
+        'timeouts': TimedQueuePool.timeouts,
+        'wait_seconds_total': round(TimedQueuePool.wait_seconds_total, 6),
+        'wait_seconds_max': round(TimedQueuePool.wait_seconds_max, 6)
+    }
+
+
+def get_async_pool_options() -> dict:
+    """
+    options of asyncpg.create_pool from the same environment variables as the engine
+    :return: keyword arguments of create_pool
+    """
+    pool_size = int(os.environ.get('DB_POOL_SIZE', 5))
+    options = {
+        'min_size': pool_size,
+        'max_size': pool_size + int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'max_inactive_connection_lifetime': int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    }
+    statement_timeout = get_statement_timeout()
+    if is_pgbouncer_mode():
+        # prepared statements do not survive transaction pooling
+        options['statement_cache_size'] = 0
+    elif statement_timeout:
+        options['server_settings'] = {'statement_timeout': str(statement_timeout)}
+
+    return options
@@ -0,0 +1,74 @@
+"""
+precompiled serializers of responses, output is byte-identical to flask_restful.marshal
+with the field definitions of resources and output_json of flask-restful outside of debug mode
+"""
+import json
+
+import flask
+
+from app.services.metrics import timed
+
+ID_LIST_CHUNK_SIZE = 1000
+
+
+def iter_id_list(entity_name: str, entity_ids):
+    """
+    encode ids as {"entity_name": [{"id": 1}, ...]} by chunks
+    :param entity_name:
+    :param entity_ids: sequence of int
+    :return: generator of parts of json-body
+    """
+    yield f'{{"{entity_name}": ['
+    for i in range(0, len(entity_ids), ID_LIST_CHUNK_SIZE):
+        prefix = ', ' if i else ''
+        yield prefix + ', '.join(f'{{"id": {entity_id}}}' for entity_id in entity_ids[i:i + ID_LIST_CHUNK_SIZE])
+    yield ']}\n'
+
+
+@timed('serialization')
+def dump_id_list(entity_name: str, entity_ids) -> str:
+    """
+    :return: json-body of list of ids
+    """
+    return ''.join(iter_id_list(entity_name, entity_ids))
+
+
+def courier_to_dict(courier) -> dict:
+    """
+    :param courier: model or object with courier columns
+    :return: courier of PATCH /couriers/$courier_id
+    """
+    return {
+        'courier_id': courier.id,
+        'courier_type': courier.courier_type,
+        'regions': courier.regions,
+        'working_hours': courier.working_hours
+    }
+
+
+def courier_statistic_to_dict(courier) -> dict:
+    """
+    :param courier: model or object with courier columns, rating and earnings
+    :return: courier of GET /couriers/$courier_id
+    """
+    result = courier_to_dict(courier)
+    result['rating'] = float(courier.rating)
+    result['earnings'] = courier.earnings
+    return result
+
+
+@timed('serialization')
+def dump(data) -> str:
+    """
+    :return: json-body
+    """
+    return json.dumps(data) + '\n'
+
+
+def response(body, status: int) -> flask.Response:
+    """
+    :param body: json-body or generator of its parts
+    :param status:
+    :return: response which flask-restful passes as is
+    """
+    return flask.Response(body, status=status, mimetype='application/json')
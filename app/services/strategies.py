@@ -0,0 +1,130 @@
+import time
+
+try:
+    import numpy as nm
+except ImportError:
+    nm = None
+
+KNAPSACK_MAX_ITEMS = 2000
+KNAPSACK_TIME_LIMIT = 0.05
+
+
+def _to_units(weights) -> [int]:
+    """
+    convert weights to hundredths, orders weight has two decimal places
+    :param weights:
+    :return: integer weights
+    """
+    if nm is not None:
+        return nm.rint(nm.asarray(weights, dtype=nm.float64) * 100).astype(nm.int64).tolist()
+    return [int(round(weight * 100)) for weight in weights]
+
+
+def greedy_first_fit(weights, capacity: float) -> [int]:
+    """
+    take orders in the given order while they fit into the courier
+    :param weights: weights of candidate orders
+    :param capacity: free capacity of the courier
+    :return: indexes of chosen orders
+    """
+    units = _to_units(weights)
+    free = int(round(capacity * 100))
+    if not units:
+        return []
+    smallest = min(units)
+
+    chosen = []
+    for index, unit in enumerate(units):
+        if free < smallest:
+            break
+        if unit <= free:
+            chosen.append(index)
+            free -= unit
+
+    return chosen
+
+
+def best_fit_decreasing(weights, capacity: float) -> [int]:
+    """
+    take the heaviest orders that still fit, for one courier it leaves the least free capacity among greedy choices
+    :param weights: weights of candidate orders
+    :param capacity: free capacity of the courier
+    :return: indexes of chosen orders
+    """
+    units = _to_units(weights)
+    free = int(round(capacity * 100))
+    if not units:
+        return []
+    if nm is not None:
+        order = nm.argsort(-nm.asarray(units), kind='stable').tolist()
+    else:
+        order = sorted(range(len(units)), key=lambda i: -units[i])
+    smallest = units[order[-1]]
+
+    chosen = []
+    for index in order:
+        if free < smallest:
+            break
+        if units[index] <= free:
+            chosen.append(index)
+            free -= units[index]
+
+    return sorted(chosen)
+
+
+def knapsack(weights, capacity: float,
+             max_items: int = KNAPSACK_MAX_ITEMS, time_limit: float = KNAPSACK_TIME_LIMIT) -> [int]:
+    """
+    fill the courier as much as possible with subset-sum dynamic programming,
+    falls back to best_fit_decreasing if the problem is too big or time_limit is exceeded
+    :param weights: weights of candidate orders
+    :param capacity: free capacity of the courier
+    :param max_items: max count of the heaviest orders used in dynamic programming
+    :param time_limit: seconds
+    :return: indexes of chosen orders
+    """
+    units = _to_units(weights)
+    free = int(round(capacity * 100))
+    if not units or free < 0:
+        return []
+    if sum(units) <= free:
+        return list(range(len(units)))
+
+    fallback = best_fit_decreasing(weights, capacity)
+    deadline = time.perf_counter() + time_limit
+    items = [index for index in sorted(range(len(units)), key=lambda i: -units[i]) if units[index] <= free]
+    items = items[:max_items]
+    mask = (1 << (free + 1)) - 1
+
+    reachable = [1]
+    for index in items:
+        if time.perf_counter() > deadline:
+            return fallback
+        reachable.append((reachable[-1] | (reachable[-1] << units[index])) & mask)
+
+    target = reachable[-1].bit_length() - 1
+    if target <= sum(units[index] for index in fallback):
+        return fallback
+
+    chosen = []
+    for position in range(len(items) - 1, -1, -1):
+        if not (reachable[position] >> target) & 1:
+            chosen.append(items[position])
+            target -= units[items[position]]
+
+    return sorted(chosen)
+
+
+strategies = {
+    'greedy': greedy_first_fit,
+    'best-fit-decreasing': best_fit_decreasing,
+    'knapsack': knapsack
+}
+
+
+def get_strategy(name: str):
+    """
+    :param name:
+    :return: assignment strategy by name
+    """
+    return strategies[name]
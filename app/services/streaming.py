@@ -0,0 +1,91 @@
+import json
+from array import array
+from itertools import islice
+
+import flask
+
+from app.models import db
+from app.services import serializer
+from app.services.bulk import BULK_INSERT_BATCH_SIZE, bulk_insert
+from app.services.data_validator import get_error_body
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def iter_ndjson(stream):
+    """
+    parse newline-delimited json without reading the whole stream
+    :param stream: binary stream of the request body
+    :return: generator of entities
+    :raises
+        ValueError if some line is not json
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_chunks(iterable, size: int):
+    """
+    :param iterable:
+    :param size: max count of items in chunk
+    :return: generator of lists
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def import_ndjson(stream, validate, get_row, model, entity_name: str, chunk_size: int = BULK_INSERT_BATCH_SIZE,
+                  on_insert=None, on_commit=None):
+    """
+    validate and insert entities of ndjson-body chunk by chunk in one transaction,
+    so memory does not depend on the size of the body
+    :param stream: binary stream of the request body
+    :param validate: Validator method for entities
+    :param get_row: function which returns values of columns by entity
+    :param model: model of entities
+    :param entity_name: name of entities in response
+    :param chunk_size: count of entities validated and inserted at once
+    :param on_insert: function which is called with rows of every chunk after it is flushed, or None,
+        the rows are not committed yet, so it can only keep what is needed after commit
+    :param on_commit: function which is called without arguments after commit, or None
+    :return: response with ids of new entities and status 201
+    :raises
+        return response with status 400 if some entity is not validated, nothing is inserted in this case
+    """
+    entity_ids = array('q')
+    error_entity_ids = []
+    seen_entity_ids = set()
+    try:
+        for chunk in iter_chunks(iter_ndjson(stream), chunk_size):
+            if not error_entity_ids:
+                # ids of inserted chunks are checked in the table, after an error nothing is inserted anymore
+                seen_entity_ids = set()
+            chunk_error_ids = validate(chunk, seen_entity_ids)
+            if chunk_error_ids is None:
+                db.session.rollback()
+                return flask.Response(status=400)
+            error_entity_ids.extend(chunk_error_ids)
+            if error_entity_ids:
+                continue
+            rows = [get_row(entity) for entity in chunk]
+            bulk_insert(model, rows, chunk_size)
+            entity_ids.extend(row['id'] for row in rows)
+            if on_insert is not None:
+                on_insert(rows)
+    except ValueError:
+        db.session.rollback()
+        return flask.Response(status=400)
+
+    if error_entity_ids:
+        db.session.rollback()
+        return get_error_body(entity_name, error_entity_ids), 400
+
+    db.session.commit()
+    if on_commit is not None:
+        on_commit()
+    return serializer.response(serializer.iter_id_list(entity_name, entity_ids), 201)
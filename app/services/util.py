@@ -1,6 +1,10 @@
-import numpy as nm
+import datetime
+import re
 
-from app.models import Courier, Order, db
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import Courier, CourierRegionStat, Order, db
 
 courier_types = {
     'foot': 10,
@@ -15,6 +19,15 @@ courier_factor = {
 }
 
 
+# the last minute of the day, windows which cross midnight are split by it
+LAST_MINUTE = 23 * 60 + 59
+
+COURIERS_PAGE_SIZE = 100
+COURIERS_PAGE_MAX = 1000
+
+DATETIME_REGEX = re.compile(r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d{1,6}))?(Z|[+-]\d{2}:\d{2})?$')
+
+
 class Object:
     pass
 
@@ -35,16 +48,77 @@ def is_courier_has_time_for_order(courier: Courier, order: Order) -> bool:
     :param order:
     :return: True if courier can accept order
     """
-    courier_times = get_time_ranges(courier.working_hours)
-    order_times = get_time_ranges(order.delivery_hours)
-    for courier_time in courier_times:
-        for order_time in order_times:
-            if courier_time >= order_time:
+    order_intervals = order.delivery_intervals
+    if order_intervals is None:
+        order_intervals = compile_time_ranges(order.delivery_hours)
+
+    return is_intervals_fit(get_working_intervals(courier), order_intervals)
+
+
+def get_working_intervals(courier: Courier) -> [int]:
+    """
+    :param courier:
+    :return: compiled courier`s working-hours
+    """
+    if courier.working_intervals is None:
+        return compile_time_ranges(courier.working_hours)
+    return courier.working_intervals
+
+
+def is_intervals_fit(courier_intervals: [int], order_intervals: [int]) -> bool:
+    """
+    compare compiled courier`s working-hours and order`s delivery-hours
+    :param courier_intervals: compiled working-hours, sorted by start
+    :param order_intervals: compiled delivery-hours
+    :return: True if one of courier`s intervals contains one of order`s intervals
+    """
+    for i in range(0, len(order_intervals), 2):
+        order_start = order_intervals[i]
+        order_finish = order_intervals[i + 1]
+        for j in range(0, len(courier_intervals), 2):
+            if courier_intervals[j] > order_start:
+                break
+            if courier_intervals[j + 1] >= order_finish:
                 return True
 
     return False
 
 
+def compile_time_ranges(ranges_str: [str]) -> [int]:
+    """
+    compile time-ranges once, so schedules can be compared without parsing
+    :param ranges_str:
+    :return: flat list of minutes [start, finish, start, finish, ...] sorted by start,
+        windows which cross midnight like '22:00-02:00' are split like in split_intervals
+    """
+    intervals = []
+    for time_range in get_time_ranges(ranges_str):
+        intervals.append(time_range.start)
+        intervals.append(time_range.finish)
+
+    return split_intervals(intervals)
+
+
+def split_intervals(intervals: [int]) -> [int]:
+    """
+    split inverted intervals of windows which cross midnight into the window till the end of the day
+    and the window since the start of the day, like '22:00-02:00' into [1320, 1439, 0, 120]
+    :param intervals: compiled hours, inverted intervals can be stored before they were split
+    :return: intervals without inverted ones sorted by start
+    """
+    windows = []
+    intervals = intervals or []
+    for i in range(0, len(intervals), 2):
+        start, finish = intervals[i], intervals[i + 1]
+        if start <= finish:
+            windows.append((start, finish))
+        else:
+            windows.append((start, LAST_MINUTE))
+            windows.append((0, finish))
+
+    return [minute for window in sorted(windows) for minute in window]
+
+
 def parse_time(time: str) -> int:
     """
     parse time-range
@@ -54,6 +128,61 @@ def parse_time(time: str) -> int:
     return int(time[:-3]) * 60 + int(time[-2:])
 
 
+def parse_datetime(value: str):
+    """
+    parse time of json-body in ISO 8601 like '2021-01-10T10:33:01.42Z'
+    :param value:
+    :return: local time without timezone like datetime.datetime.now(), or None if value is not a time
+    """
+    m = DATETIME_REGEX.match(value)
+    if m is None:
+        return None
+    try:
+        result = datetime.datetime.strptime(m.group(1), '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+    if m.group(2):
+        result = result.replace(microsecond=int(m.group(2).ljust(6, '0')))
+    if m.group(3):
+        offset = datetime.timedelta()
+        if m.group(3) != 'Z':
+            offset = datetime.timedelta(hours=int(m.group(3)[1:3]), minutes=int(m.group(3)[4:]))
+            if m.group(3)[0] == '-':
+                offset = -offset
+        result = result.replace(tzinfo=datetime.timezone(offset)).astimezone().replace(tzinfo=None)
+
+    return result
+
+
+def get_courier_row(data: dict) -> dict:
+    """
+    :param data: courier from json-body
+    :return: values of couriers columns
+    """
+    return {
+        'id': data['courier_id'],
+        'courier_type': data['courier_type'],
+        'regions': data['regions'],
+        'working_hours': data['working_hours'],
+        'working_intervals': compile_time_ranges(data['working_hours']),
+        'count_delivery': 0
+    }
+
+
+def get_order_row(data: dict) -> dict:
+    """
+    :param data: order from json-body
+    :return: values of orders columns
+    """
+    return {
+        'id': data['order_id'],
+        'weight': round(data['weight'], 2),
+        'region': data['region'],
+        'delivery_hours': data['delivery_hours'],
+        'delivery_intervals': compile_time_ranges(data['delivery_hours'])
+    }
+
+
 def get_time_ranges(ranges_str: [str]) -> [TimeRange]:
     """
     :param ranges_str:
@@ -80,28 +209,94 @@ def get_courier_rating(courier: Courier) -> float:
     :param courier:
     :return: courier rating
     """
-    times_by_regions = []
-
-    orders = db.session \
-        .query(Order) \
-        .filter(Order.courier_id == courier.id,
-                Order.delivery_time.isnot(None)) \
+    stats = db.session \
+        .query(CourierRegionStat.delivery_time_sum, CourierRegionStat.delivery_count) \
+        .filter(CourierRegionStat.courier_id == courier.id) \
         .all()
-    delivery_times_by_region = {}
-    for order in orders:
-        if order.region not in delivery_times_by_region:
-            delivery_times_by_region[order.region] = [order.delivery_time]
-        else:
-            delivery_times_by_region[order.region].append(order.delivery_time)
-    for times in delivery_times_by_region.values():
-        times_by_regions.append(nm.mean(times))
+
+    return calculate_courier_rating(stats)
+
+
+def set_couriers_statistic(couriers: [Courier]) -> None:
+    """
+    set rating and earnings of couriers, ratings of all couriers are found by one grouped query
+    :param couriers:
+    """
+    if not couriers:
+        return
+    min_times = dict(db.session
+                     .query(CourierRegionStat.courier_id,
+                            func.min(CourierRegionStat.delivery_time_sum / CourierRegionStat.delivery_count))
+                     .filter(CourierRegionStat.courier_id.in_([courier.id for courier in couriers]),
+                             CourierRegionStat.delivery_count > 0)
+                     .group_by(CourierRegionStat.courier_id)
+                     .all())
+    for courier in couriers:
+        courier.rating = round(calculate_rating(min_times.get(courier.id, float('inf'))), 2)
+        courier.earnings = get_earnings(courier)
+
+
+def calculate_courier_rating(stats: [tuple]) -> float:
+    """
+    :param stats: sum and count of delivery-times by regions
+    :return: courier rating
+    """
     time = float('inf')
+    times_by_regions = [time_sum / count for time_sum, count in stats if count]
     if times_by_regions:
         time = min(times_by_regions)
 
     return round(calculate_rating(time), 2)
 
 
+def add_delivery_time(courier_id: int, region: int, delivery_time: float) -> None:
+    """
+    add delivery-time of completed order to courier`s statistic, commit is up to the caller
+    :param courier_id:
+    :param region:
+    :param delivery_time:
+    """
+    statement = insert(CourierRegionStat.__table__).values(
+        courier_id=courier_id,
+        region=region,
+        delivery_time_sum=delivery_time,
+        delivery_count=1
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['courier_id', 'region'],
+        set_={
+            'delivery_time_sum': CourierRegionStat.delivery_time_sum + statement.excluded.delivery_time_sum,
+            'delivery_count': CourierRegionStat.delivery_count + statement.excluded.delivery_count
+        }
+    )
+    db.session.execute(statement)
+
+
+def rebuild_courier_stats() -> int:
+    """
+    rebuild couriers` statistic from completed orders
+    :return: count of statistic rows
+    """
+    db.session.query(CourierRegionStat).delete(synchronize_session=False)
+    stats_query = db.session \
+        .query(Order.courier_id,
+               Order.region,
+               func.sum(Order.delivery_time),
+               func.count(Order.delivery_time)) \
+        .filter(Order.courier_id.isnot(None),
+                Order.delivery_time.isnot(None)) \
+        .group_by(Order.courier_id, Order.region)
+    db.session.execute(
+        insert(CourierRegionStat.__table__).from_select(
+            ['courier_id', 'region', 'delivery_time_sum', 'delivery_count'],
+            stats_query.statement
+        )
+    )
+    db.session.commit()
+
+    return db.session.query(CourierRegionStat).count()
+
+
 def get_earnings(courier: Courier) -> int:
     """
     :param courier:
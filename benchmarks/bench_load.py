@@ -0,0 +1,129 @@
+"""
+load benchmark of the flask application against the asyncio application
+
+both applications must be running on the same database, every target gets its own couriers and orders,
+then GET /couriers/$courier_id and POST /orders/assign are sent with the given concurrency,
+requests per second and latency percentiles are printed for every target
+
+run from the project root:
+    gunicorn -c gunicorn.conf.py -b 0.0.0.0:8080 "main:create_app()"
+    GUNICORN_WORKER_CLASS=aiohttp.GunicornWebWorker gunicorn -c gunicorn.conf.py -b 0.0.0.0:8090 "aio_main:create_app()"
+    python -m benchmarks.bench_load --target sync=http://localhost:8080 --target async=http://localhost:8090
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+
+def generate_data(couriers: int, orders: int, id_offset: int, seed: int) -> (list, list):
+    """
+    :param couriers: count of couriers
+    :param orders: count of orders
+    :param id_offset: first id of couriers and orders of the target
+    :param seed:
+    :return: couriers and orders of json-bodies
+    """
+    rng = random.Random(seed)
+    courier_list = [{
+        'courier_id': id_offset + i,
+        'courier_type': rng.choice(['foot', 'bike', 'car']),
+        'regions': rng.sample(range(1, 21), 3),
+        'working_hours': ['08:00-20:00']
+    } for i in range(couriers)]
+    order_list = [{
+        'order_id': id_offset + i,
+        'weight': round(rng.uniform(0.01, 5), 2),
+        'region': rng.randint(1, 20),
+        'delivery_hours': [f'{rng.randint(8, 17):02d}:00-{rng.randint(18, 19):02d}:00']
+    } for i in range(orders)]
+    return courier_list, order_list
+
+
+async def prepare(session: aiohttp.ClientSession, url: str, couriers: list, orders: list) -> None:
+    for path, name, entities in (('/couriers', 'couriers', couriers), ('/orders', 'orders', orders)):
+        async with session.post(url + path, data=json.dumps({'data': entities})) as response:
+            if response.status != 201:
+                raise RuntimeError(f'{url}{path}: {response.status} {await response.text()}')
+
+
+async def run_load(session: aiohttp.ClientSession, make_request, requests: int, concurrency: int) -> (float, list):
+    """
+    :param make_request: function of request number which returns method, url and json-body
+    :return: seconds of the whole load and latencies of requests
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for number in counter:
+            method, url, body = make_request(number)
+            started = time.perf_counter()
+            async with session.request(method, url, data=body and json.dumps(body)) as response:
+                await response.read()
+                if response.status >= 500:
+                    errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    if errors:
+        print(f'  {errors} responses with status 5xx')
+    return time.perf_counter() - started, latencies
+
+
+def percentile(values: [float], share: float) -> float:
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def report(name: str, seconds: float, latencies: [float]) -> None:
+    latencies = sorted(latencies)
+    print(f'  {name:<7} {len(latencies) / seconds:8.1f} rps   '
+          f'p50 {percentile(latencies, 0.5) * 1000:7.1f} ms   '
+          f'p95 {percentile(latencies, 0.95) * 1000:7.1f} ms   '
+          f'p99 {percentile(latencies, 0.99) * 1000:7.1f} ms')
+
+
+async def bench(args) -> None:
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for index, target in enumerate(args.target):
+            name, url = target.split('=', 1)
+            id_offset = args.id_offset + index * max(args.couriers, args.orders)
+            couriers, orders = generate_data(args.couriers, args.orders, id_offset, args.seed)
+            await prepare(session, url, couriers, orders)
+
+            print(f'{name} {url}, concurrency {args.concurrency}')
+            report('get', *await run_load(
+                session,
+                lambda number: ('GET', f'{url}/couriers/{id_offset + number % args.couriers}', None),
+                args.requests, args.concurrency
+            ))
+            report('assign', *await run_load(
+                session,
+                lambda number: ('POST', f'{url}/orders/assign', {'courier_id': id_offset + number % args.couriers}),
+                args.requests, args.concurrency
+            ))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help='name=url of the application')
+    parser.add_argument('--requests', type=int, default=5000, help='count of requests of every kind')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--couriers', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--id-offset', type=int, default=10 ** 8, help='first id of generated entities')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(bench(args))
+
+
+if __name__ == '__main__':
+    main()
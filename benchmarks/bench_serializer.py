@@ -0,0 +1,90 @@
+"""
+micro-benchmark of response serialization
+
+compares flask_restful.marshal with the former field definitions of resources and the serializers
+of app.services.serializer, output of both is checked to be byte-identical
+
+run from the project root:
+    python -m benchmarks.bench_serializer --items 10000
+"""
+import argparse
+import json
+import random
+import time
+
+from flask_restful import fields, marshal
+
+from app.services import serializer
+from app.services.util import Object
+
+order_list_fields = {
+    'orders': fields.List(fields.Nested({'id': fields.Integer(attribute='id')}))
+}
+
+courier_get_fields = {
+    'courier_id': fields.Integer(attribute='id'),
+    'courier_type': fields.String,
+    'regions': fields.List(fields.Integer),
+    'working_hours': fields.List(fields.String),
+    'rating': fields.Float,
+    'earnings': fields.Integer
+}
+
+
+def generate_couriers(count: int, seed: int) -> [Object]:
+    rng = random.Random(seed)
+    couriers = []
+    for courier_id in range(count):
+        courier = Object()
+        courier.id = courier_id
+        courier.courier_type = rng.choice(['foot', 'bike', 'car'])
+        courier.regions = rng.sample(range(1, 100), 3)
+        courier.working_hours = ['09:00-12:00', '14:00-18:00']
+        courier.rating = round(rng.uniform(0, 5), 2)
+        courier.earnings = rng.randint(0, 10 ** 6)
+        couriers.append(courier)
+    return couriers
+
+
+def best_seconds(function, repeat: int) -> (float, str):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = function()
+        best = min(best, time.perf_counter() - started)
+    return best, body
+
+
+def compare(name: str, before, after, repeat: int) -> None:
+    before_seconds, before_body = best_seconds(before, repeat)
+    after_seconds, after_body = best_seconds(after, repeat)
+    if before_body != after_body:
+        raise AssertionError(f'{name}: output differs')
+    print(f'{name}: marshal {before_seconds * 1000:.2f} ms, serializer {after_seconds * 1000:.2f} ms, '
+          f'speedup {before_seconds / after_seconds:.1f}x')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    order_ids = list(range(1, args.items + 1))
+    couriers = generate_couriers(args.items, args.seed)
+
+    def marshal_id_list():
+        result = Object()
+        result.orders = [{'id': order_id} for order_id in order_ids]
+        return json.dumps(marshal(result, order_list_fields)) + '\n'
+
+    compare('id list', marshal_id_list, lambda: serializer.dump_id_list('orders', order_ids), args.repeat)
+    compare('couriers',
+            lambda: json.dumps([marshal(courier, courier_get_fields) for courier in couriers]) + '\n',
+            lambda: serializer.dump([serializer.courier_statistic_to_dict(courier) for courier in couriers]),
+            args.repeat)
+
+
+if __name__ == '__main__':
+    main()
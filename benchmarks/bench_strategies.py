@@ -0,0 +1,71 @@
+"""
+benchmark of assignment strategies on synthetic backlogs
+
+run from the project root:
+    python -m benchmarks.bench_strategies --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as nm
+
+from app.services import strategies, util
+
+
+def generate_weights(size: int, seed: int):
+    """
+    :param size: count of orders
+    :param seed:
+    :return: weights of orders with two decimal places
+    """
+    rng = nm.random.RandomState(seed)
+    weights = rng.lognormal(mean=0.5, sigma=0.9, size=size).clip(0.01, 50)
+    return nm.round(weights, 2)
+
+
+def run(sizes: [int], couriers: int, seed: int) -> [dict]:
+    """
+    solve assignment for couriers of every type on every backlog
+    :return: results by strategy and backlog size
+    """
+    results = []
+    for size in sizes:
+        weights = generate_weights(size, seed)
+        for name, strategy in strategies.strategies.items():
+            elapsed = 0.0
+            filled = 0.0
+            capacity_total = 0.0
+            for courier in range(couriers):
+                courier_type = list(util.courier_types)[courier % len(util.courier_types)]
+                capacity = util.get_weight_by_type(courier_type)
+                candidates = weights[weights <= capacity]
+                started = time.perf_counter()
+                chosen = strategy(candidates, capacity)
+                elapsed += time.perf_counter() - started
+                filled += float(candidates[chosen].sum()) if chosen else 0.0
+                capacity_total += capacity
+            results.append({
+                'strategy': name,
+                'orders': size,
+                'orders_per_second': round(size * couriers / elapsed),
+                'fill_rate': round(filled / capacity_total, 4)
+            })
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--couriers', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'strategy':<22}{'orders':>10}{'orders/s':>14}{'fill rate':>12}")
+    for result in run(args.sizes, args.couriers, args.seed):
+        print(f"{result['strategy']:<22}{result['orders']:>10}"
+              f"{result['orders_per_second']:>14}{result['fill_rate']:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+micro-benchmark of per-entity validation of POST /orders
+
+compares jsonschema.validate on every entity with the validator built once in Validator
+(compiled by fastjsonschema if it is installed), the existing-id query is not included
+
+run from the project root:
+    python -m benchmarks.bench_validator --orders 10000
+"""
+import argparse
+import random
+import time
+
+import jsonschema
+
+from app.services.data_validator import Validator, _load_schema, valid_time_list
+
+
+def generate_orders(count: int, seed: int) -> [dict]:
+    """
+    :param count: count of orders
+    :param seed:
+    :return: orders of json-body
+    """
+    rng = random.Random(seed)
+    orders = []
+    for order_id in range(count):
+        start = rng.randint(0, 20)
+        orders.append({
+            'order_id': order_id,
+            'weight': round(rng.uniform(0.01, 50), 2),
+            'region': rng.randint(1, 100),
+            'delivery_hours': [f'{start:02d}:00-{start + rng.randint(1, 3):02d}:30']
+        })
+    return orders
+
+
+def per_entity_seconds(validate, orders: [dict]) -> float:
+    started = time.perf_counter()
+    for order in orders:
+        validate(order)
+    return (time.perf_counter() - started) / len(orders)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    orders = generate_orders(args.orders, args.seed)
+    schema = _load_schema('order_post_schema.json')
+    validator = Validator()
+
+    def validate_before(order):
+        jsonschema.validate(instance=order, schema=schema)
+        valid_time_list(order['delivery_hours'])
+
+    def validate_after(order):
+        validator.order_post_validator.is_valid(order)
+        valid_time_list(order['delivery_hours'])
+
+    before = per_entity_seconds(validate_before, orders)
+    after = per_entity_seconds(validate_after, orders)
+    print(f'jsonschema.validate per entity: {before * 1e6:.1f} us')
+    print(f'prebuilt validator per entity:  {after * 1e6:.1f} us')
+    print(f'speedup: {before / after:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+compare two result files of benchmarks.suite, speedup is the ratio of time per item before and after
+
+run from the project root:
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+
+def load(path: str) -> (dict, dict):
+    """
+    :return: report and its results by name and scale
+    """
+    with open(path) as file:
+        report = json.load(file)
+    return report, {(result['name'], result['scale']): result for result in report['results']}
+
+
+def describe(report: dict) -> str:
+    commit = (report.get('commit') or 'unknown')[:10]
+    return f"{commit}{' (dirty)' if report.get('dirty') else ''} {report.get('created', '')}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    before_report, before = load(args.before)
+    after_report, after = load(args.after)
+    print(f'before: {describe(before_report)}')
+    print(f'after:  {describe(after_report)}')
+    print(f"{'benchmark':<22}{'scale':>6}{'before us':>14}{'after us':>14}{'speedup':>10}")
+    for key in sorted(before.keys() & after.keys()):
+        before_us = before[key]['us_per_item']
+        after_us = after[key]['us_per_item']
+        speedup = before_us / after_us if after_us else float('inf')
+        print(f'{key[0]:<22}{key[1]:>6}{before_us:>14.1f}{after_us:>14.1f}{speedup:>9.2f}x')
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{key[0]:<22}{key[1]:>6}  only {'before' if key in before else 'after'}")
+
+
+if __name__ == '__main__':
+    main()
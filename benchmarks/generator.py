@@ -0,0 +1,137 @@
+"""
+seeded generator of couriers and orders of json-bodies
+
+couriers serve a few neighbouring regions and work one to three shifts, regions differ in popularity,
+order weights are log-normal and delivery windows are one to four hours long, a small share of windows
+crosses midnight like '22:00-01:00'. The same seed gives the same data, couriers do not depend on count of orders
+"""
+import random
+
+from app.services import util
+
+# count of couriers and orders by scale name
+SCALES = {
+    '1k': (100, 1000),
+    '100k': (10000, 100000),
+    '1M': (100000, 1000000)
+}
+
+COURIER_TYPE_SHARES = {'foot': 0.4, 'bike': 0.35, 'car': 0.25}
+MIDNIGHT_WINDOW_SHARE = 0.01
+
+
+def get_region_count(couriers: int) -> int:
+    """
+    :param couriers: count of couriers
+    :return: count of regions, about 25 couriers per region
+    """
+    return max(20, couriers // 25)
+
+
+def format_minutes(minutes: int) -> str:
+    minutes %= 24 * 60
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def generate_shifts(rng: random.Random, count: int) -> [str]:
+    """
+    :return: sorted time-ranges which do not overlap, aligned by 30 minutes between 06:00 and 23:00
+    """
+    bounds = sorted(rng.sample(range(12, 47), count * 2))
+    return [f'{format_minutes(bounds[i] * 30)}-{format_minutes(bounds[i + 1] * 30)}'
+            for i in range(0, len(bounds), 2)]
+
+
+def generate_couriers(count: int, seed: int = 0, regions: int = None, id_offset: int = 1) -> [dict]:
+    """
+    :param count: count of couriers
+    :param seed:
+    :param regions: count of regions, by default get_region_count
+    :param id_offset: id of the first courier
+    :return: couriers of json-body
+    """
+    rng = random.Random(seed)
+    regions = regions or get_region_count(count)
+    courier_types = list(COURIER_TYPE_SHARES)
+    shares = list(COURIER_TYPE_SHARES.values())
+    couriers = []
+    for i in range(count):
+        home = rng.randint(1, regions)
+        neighbours = {home}
+        for _ in range(rng.randint(0, 3)):
+            neighbours.add(min(regions, max(1, home + rng.randint(-3, 3))))
+        couriers.append({
+            'courier_id': id_offset + i,
+            'courier_type': rng.choices(courier_types, shares)[0],
+            'regions': sorted(neighbours),
+            'working_hours': generate_shifts(rng, rng.choices([1, 2, 3], [0.5, 0.35, 0.15])[0])
+        })
+    return couriers
+
+
+def generate_orders(count: int, seed: int = 0, regions: int = None, id_offset: int = 1) -> [dict]:
+    """
+    :param count: count of orders
+    :param seed:
+    :param regions: count of regions, by default get_region_count of count / 10 couriers
+    :param id_offset: id of the first order
+    :return: orders of json-body
+    """
+    rng = random.Random(seed + 1)
+    regions = regions or get_region_count(count // 10)
+    # popularity of regions falls with their rank
+    region_weights = [1 / (rank ** 0.8) for rank in range(1, regions + 1)]
+    region_ids = list(range(1, regions + 1))
+    rng.shuffle(region_ids)
+    orders = []
+    for i in range(count):
+        if rng.random() < MIDNIGHT_WINDOW_SHARE:
+            start = rng.randint(44, 47) * 30
+            delivery_hours = [f'{format_minutes(start)}-{format_minutes(start + rng.randint(2, 8) * 30)}']
+        else:
+            delivery_hours = []
+            for _ in range(rng.choices([1, 2], [0.8, 0.2])[0]):
+                start = rng.randint(16, 38) * 30
+                delivery_hours.append(f'{format_minutes(start)}-{format_minutes(start + rng.randint(2, 8) * 30)}')
+        orders.append({
+            'order_id': id_offset + i,
+            'weight': round(min(50.0, max(0.01, rng.lognormvariate(0.5, 0.9))), 2),
+            'region': rng.choices(region_ids, region_weights)[0],
+            'delivery_hours': delivery_hours
+        })
+    return orders
+
+
+def generate_scale(scale: str, seed: int = 0, id_offset: int = 1) -> ([dict], [dict]):
+    """
+    :param scale: name of SCALES
+    :return: couriers and orders of the same regions
+    """
+    courier_count, order_count = SCALES[scale]
+    regions = get_region_count(courier_count)
+    return generate_couriers(courier_count, seed, regions, id_offset), \
+        generate_orders(order_count, seed, regions, id_offset)
+
+
+def to_courier(data: dict) -> util.Object:
+    """
+    :param data: courier of json-body
+    :return: object with columns of courier like a loaded model
+    """
+    row = util.get_courier_row(data)
+    courier = util.Object()
+    for name, value in row.items():
+        setattr(courier, name, value)
+    return courier
+
+
+def to_order(data: dict) -> util.Object:
+    """
+    :param data: order of json-body
+    :return: object with columns of order like a loaded model
+    """
+    row = util.get_order_row(data)
+    order = util.Object()
+    for name, value in row.items():
+        setattr(order, name, value)
+    return order
@@ -0,0 +1,301 @@
+"""
+benchmark suite of hot paths on generated data, results are written as json to compare commits
+
+hot paths are run in isolation, without the database:
+    time-check          util.is_courier_has_time_for_order for pairs of couriers and orders
+    rating              util.calculate_courier_rating of statistic rows of couriers
+    validate-orders     Validator checks of POST /orders without the existing-id query
+    dispatch-plan       dispatcher.make_plan of the whole backlog
+with --endpoints the flask application is called by its test client on the scratch database of POSTGRES_*
+variables (POSTGRES_HOST=localhost for a local server) which must have no couriers and orders,
+generated rows are deleted after the run:
+    validate-post-order, post-couriers, post-orders, get-courier, assign, complete, complete-batch, courier-rating
+    candidates          assignment.get_candidate_orders of couriers, which checks regions, weight and time
+    assign-candidates   candidate loop of AssignOrders.post: the candidate query, OrderBatch and OrderClaim
+                        with the strategy, orders are not claimed
+
+run from the project root:
+    python -m benchmarks.suite --scale 1k 100k --output results.json
+    POSTGRES_HOST=localhost python -m benchmarks.suite --scale 1k --endpoints --output results.json
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import subprocess
+import time
+
+from app.services import assignment, dispatcher, strategies, util
+from app.services.data_validator import Validator
+from app.services.matcher import OrderBatch, OrderClaim, nm
+from benchmarks import generator
+
+POST_CHUNK_SIZE = 1000
+
+
+def make_result(name: str, scale: str, count: int, seconds: float, **extra) -> dict:
+    """
+    :param count: count of items processed in seconds
+    :return: result of one benchmark
+    """
+    result = {
+        'name': name,
+        'scale': scale,
+        'count': count,
+        'seconds': round(seconds, 6),
+        'us_per_item': round(seconds / count * 1e6, 3),
+        'items_per_second': round(count / seconds, 1)
+    }
+    result.update(extra)
+    return result
+
+
+def best_seconds(function, repeat: int) -> (float, object):
+    """
+    :return: the least seconds of repeat runs and value of the last run
+    """
+    best = float('inf')
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = function()
+        best = min(best, time.perf_counter() - started)
+    return best, value
+
+
+def percentiles(latencies: [float]) -> dict:
+    latencies = sorted(latencies)
+    return {f'p{share}_ms': round(latencies[min(len(latencies) - 1, len(latencies) * share // 100)] * 1000, 3)
+            for share in (50, 95, 99)}
+
+
+def get_commit() -> dict:
+    """
+    :return: commit of the working tree and whether it has uncommitted changes, None outside of git
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                         stderr=subprocess.DEVNULL).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': bool(status.strip())}
+
+
+def run_isolated(scale: str, couriers: [dict], orders: [dict], args) -> [dict]:
+    results = []
+    courier_objects = [generator.to_courier(courier) for courier in couriers]
+    order_objects = [generator.to_order(order) for order in orders]
+
+    def time_check():
+        return sum(util.is_courier_has_time_for_order(courier_objects[i % len(courier_objects)], order)
+                   for i, order in enumerate(order_objects))
+
+    seconds, matched = best_seconds(time_check, args.repeat)
+    results.append(make_result('time-check', scale, len(order_objects), seconds,
+                               matched_share=round(matched / len(order_objects), 4)))
+
+    rng = random.Random(args.seed)
+    stats = [[(rng.uniform(300, 7200) * count, count) for count in rng.choices(range(0, 50), k=len(courier.regions))]
+             for courier in courier_objects]
+    seconds, _ = best_seconds(lambda: [util.calculate_courier_rating(rows) for rows in stats], args.repeat)
+    results.append(make_result('rating', scale, len(stats), seconds))
+
+    validator = Validator()
+
+    def validate_orders():
+        invalid_indexes, _ = validator.check_entities('orders', orders)
+        return validator.get_error_ids('orders', orders, invalid_indexes, set())
+
+    seconds, errors = best_seconds(validate_orders, args.repeat)
+    results.append(make_result('validate-orders', scale, len(orders), seconds, errors=len(errors)))
+
+    courier_rows = [(courier.id, float(util.get_weight_by_type(courier.courier_type)), courier.regions,
+                     courier.working_intervals) for courier in courier_objects]
+    order_rows = [(order.id, order.weight, order.region, order.delivery_intervals, None) for order in order_objects]
+    seconds, plan = best_seconds(lambda: dispatcher.make_plan(courier_rows, order_rows), args.repeat)
+    results.append(make_result('dispatch-plan', scale, len(order_rows), seconds, planned=len(plan)))
+
+    return results
+
+
+def run_endpoints(scale: str, couriers: [dict], orders: [dict], args) -> [dict]:
+    import main
+    from app.models import Courier, db
+
+    app = main.create_app()
+    client = app.test_client()
+    results = []
+
+    def post(url: str, body: dict):
+        response = client.post(url, data=json.dumps(body))
+        if response.status_code >= 300:
+            raise RuntimeError(f'{url}: {response.status_code} {response.data[:200]}')
+        return response
+
+    def timed(requests) -> [float]:
+        latencies = []
+        for request in requests:
+            started = time.perf_counter()
+            request()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    with app.app_context():
+        check_empty_database()
+
+    validator = Validator()
+    with app.app_context():
+        started = time.perf_counter()
+        for i in range(0, len(orders), POST_CHUNK_SIZE):
+            validator.validate_post_order({'data': orders[i:i + POST_CHUNK_SIZE]})
+        results.append(make_result('validate-post-order', scale, len(orders), time.perf_counter() - started))
+        db.session.rollback()
+
+    try:
+        for name, url, entities in (('post-couriers', '/couriers', couriers), ('post-orders', '/orders', orders)):
+            started = time.perf_counter()
+            for i in range(0, len(entities), POST_CHUNK_SIZE):
+                post(url, {'data': entities[i:i + POST_CHUNK_SIZE]})
+            results.append(make_result(name, scale, len(entities), time.perf_counter() - started))
+
+        sample = [courier['courier_id'] for courier in couriers[:args.sample]]
+        with app.app_context():
+            loaded = [assignment.get_courier_load(courier_id) for courier_id in sample]
+            db.session.rollback()
+            queries = [(courier.regions, util.get_weight_by_type(courier.courier_type) - courier.assigned_weight,
+                        util.get_working_intervals(courier)) for courier in loaded]
+
+            candidates = []
+            latencies = timed(lambda query=query: candidates.append(assignment.get_candidate_orders(*query))
+                              for query in queries)
+            results.append(make_result('candidates', scale, len(queries), sum(latencies),
+                                       candidates=sum(len(rows) for rows in candidates), **percentiles(latencies)))
+
+            strategy = strategies.get_strategy(args.strategy)
+
+            def choose(regions: [int], weight: float, courier_intervals: [int]) -> [int]:
+                batch = OrderBatch(assignment.get_candidate_orders(regions, weight, courier_intervals))
+                return OrderClaim(batch, list(range(len(batch))), weight, strategy, 1).choose()
+
+            chosen = []
+            latencies = timed(lambda query=query: chosen.append(choose(*query)) for query in queries)
+            results.append(make_result('assign-candidates', scale, len(queries), sum(latencies),
+                                       strategy=args.strategy, chosen=sum(len(order_ids) for order_ids in chosen),
+                                       **percentiles(latencies)))
+            db.session.rollback()
+
+        latencies = timed(lambda courier_id=courier_id: client.get(f'/couriers/{courier_id}') for courier_id in sample)
+        results.append(make_result('get-courier', scale, len(sample), sum(latencies), **percentiles(latencies)))
+
+        assigned = {}
+
+        def assign(courier_id: int) -> None:
+            assigned[courier_id] = post('/orders/assign', {'courier_id': courier_id}).get_json()['orders']
+
+        latencies = timed(lambda courier_id=courier_id: assign(courier_id) for courier_id in sample)
+        results.append(make_result('assign', scale, len(sample), sum(latencies),
+                                   assigned=sum(len(order_ids) for order_ids in assigned.values()),
+                                   **percentiles(latencies)))
+
+        completes = [{'courier_id': courier_id, 'order_id': order_ids[0]['id']}
+                     for courier_id, order_ids in assigned.items() if order_ids]
+        if completes:
+            latencies = timed(lambda body=body: post('/orders/complete', body) for body in completes)
+            results.append(make_result('complete', scale, len(completes), sum(latencies), **percentiles(latencies)))
+
+        items = [{'courier_id': courier_id, 'order_id': order_id['id']}
+                 for courier_id, order_ids in assigned.items() for order_id in order_ids[1:]]
+        if items:
+            started = time.perf_counter()
+            for i in range(0, len(items), POST_CHUNK_SIZE):
+                complete_time = datetime.datetime.now().isoformat()
+                post('/orders/complete/batch',
+                     {'data': [dict(item, complete_time=complete_time) for item in items[i:i + POST_CHUNK_SIZE]]})
+            results.append(make_result('complete-batch', scale, len(items), time.perf_counter() - started))
+
+        with app.app_context():
+            loaded = Courier.query.filter(Courier.id.in_(sample)).all()
+            latencies = timed(lambda courier=courier: util.get_courier_rating(courier) for courier in loaded)
+            results.append(make_result('courier-rating', scale, len(loaded), sum(latencies),
+                                       **percentiles(latencies)))
+            db.session.rollback()
+    finally:
+        with app.app_context():
+            delete_generated(couriers, orders)
+
+    return results
+
+
+def check_empty_database() -> None:
+    """
+    generated couriers take and complete any unassigned orders of their regions,
+    so endpoints are only called on a database without couriers and orders
+    :raises
+        RuntimeError if the database has couriers or orders
+    """
+    from app.models import db
+
+    exists = db.session.execute('SELECT EXISTS (SELECT 1 FROM couriers) OR EXISTS (SELECT 1 FROM orders)').scalar()
+    db.session.rollback()
+    if exists:
+        raise RuntimeError('--endpoints needs a scratch database without couriers and orders')
+
+
+def delete_generated(couriers: [dict], orders: [dict]) -> None:
+    """
+    delete generated couriers and orders with their deliveries and statistic
+    """
+    from app.models import db
+
+    params = {
+        'courier_ids': [courier['courier_id'] for courier in couriers],
+        'order_ids': [order['order_id'] for order in orders]
+    }
+    db.session.execute('DELETE FROM courier_region_stats WHERE courier_id = ANY(:courier_ids)', params)
+    db.session.execute('DELETE FROM orders WHERE id = ANY(:order_ids)', params)
+    db.session.execute('DELETE FROM deliveries WHERE courier_id = ANY(:courier_ids)', params)
+    db.session.execute('DELETE FROM couriers WHERE id = ANY(:courier_ids)', params)
+    db.session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', nargs='+', choices=list(generator.SCALES), default=['1k'])
+    parser.add_argument('--endpoints', action='store_true', help='call endpoints on the database')
+    parser.add_argument('--sample', type=int, default=200, help='count of couriers of per-courier benchmarks')
+    parser.add_argument('--strategy', choices=list(strategies.strategies), default='greedy')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of isolated benchmarks, the best is taken')
+    parser.add_argument('--id-offset', type=int, default=2 * 10 ** 8, help='first id of generated entities')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='path of the json with results')
+    args = parser.parse_args()
+
+    report = get_commit()
+    report.update({
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': nm.__version__ if nm is not None else None,
+        'seed': args.seed,
+        'results': []
+    })
+    print(f"{'benchmark':<22}{'scale':>6}{'count':>10}{'seconds':>12}{'us/item':>12}")
+    for scale in args.scale:
+        couriers, orders = generator.generate_scale(scale, args.seed, args.id_offset)
+        results = run_isolated(scale, couriers, orders, args)
+        if args.endpoints:
+            results += run_endpoints(scale, couriers, orders, args)
+        for result in results:
+            print(f"{result['name']:<22}{scale:>6}{result['count']:>10}"
+                  f"{result['seconds']:>12.4f}{result['us_per_item']:>12.1f}")
+        report['results'] += results
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
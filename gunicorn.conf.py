@@ -0,0 +1,32 @@
+"""
+gunicorn settings of the production server, every setting can be changed by environment variables
+
+run:
+    gunicorn -c gunicorn.conf.py "main:create_app()"
+    GUNICORN_WORKER_CLASS=aiohttp.GunicornWebWorker gunicorn -c gunicorn.conf.py "aio_main:create_app()"
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def post_fork(server, worker):
+    """
+    connections opened by the master before fork must not be shared between workers
+    """
+    # the asyncio application opens its pool in every worker on startup
+    if preload_app and worker_class in ('sync', 'gthread'):
+        from app.models import db
+        with server.app.wsgi().app_context():
+            db.engine.dispose()
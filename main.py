@@ -1,41 +1,119 @@
-from flask import Flask
+import logging
+import os
+
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
 from flask_restful import Api
+from flask_restful.representations.json import output_json
 
 from app import models
 from app.models import db
 from app.resources.courier import Couriers
-from app.resources.order import AssignOrders, CompleteOrder, Orders
+from app.resources.order import AssignOrders, CompleteOrder, CompleteOrders, Orders
+from app.resources.status import Metrics, OrderIndexStatus, PoolStatus
+from app.services import archive, cache, dispatcher, metrics, order_index, pool, strategies, util
 from app.services.data_validator import Validator
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = models.get_db_url()
-app.app_context().push()
-db.init_app(app)
-api = Api(app)
-
-validator = Validator()
-
-api.add_resource(
-    Couriers,
-    '/couriers',
-    '/couriers/<int:courier_id>',
-    resource_class_kwargs={'validator': validator}
-)
-api.add_resource(
-    Orders,
-    '/orders',
-    resource_class_kwargs={'validator': validator}
-)
-api.add_resource(
-    AssignOrders,
-    '/orders/assign',
-    resource_class_kwargs={'validator': validator}
-)
-api.add_resource(
-    CompleteOrder,
-    '/orders/complete',
-    resource_class_kwargs={'validator': validator}
-)
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats():
+    """rebuild couriers` rating statistic from completed orders"""
+    print(f'rebuilt {util.rebuild_courier_stats()} statistic rows')
+
+
+@click.command('dispatch')
+@click.option('--interval', type=float, default=dispatcher.DISPATCH_INTERVAL, help='seconds between plans')
+@click.option('--processes', type=int, default=dispatcher.DISPATCH_PROCESSES,
+              help='count of processes which plan groups of regions')
+@click.option('--once', is_flag=True, help='plan once and exit')
+@with_appcontext
+def dispatch(interval, processes, once):
+    """plan unassigned orders for all couriers periodically"""
+    # stats of every plan are logged at INFO
+    current_app.logger.setLevel(logging.INFO)
+    dispatcher.run(interval, processes, once)
+
+
+@click.command('archive-orders')
+@click.option('--days', type=float, default=archive.ARCHIVE_AFTER_DAYS, help='age of archived completed orders')
+@click.option('--batch-size', type=int, default=archive.ARCHIVE_BATCH_SIZE, help='count of orders in one transaction')
+@with_appcontext
+def archive_orders(days, batch_size):
+    """move old completed orders to partitions by month"""
+    print(archive.archive_orders(days, batch_size))
+
+
+def create_app() -> Flask:
+    """
+    create and configure the application, used by gunicorn as 'main:create_app()'
+    :return: application
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = models.get_db_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool.get_engine_options()
+    db.init_app(app)
+    pool.configure_engine(db.get_engine(app))
+    api = Api(app)
+    if metrics.METRICS_ENABLED:
+        metrics.instrument_app(app)
+        metrics.instrument_engine(db.get_engine(app))
+        api.representations['application/json'] = metrics.timed('serialization')(output_json)
+
+    validator = Validator()
+    courier_cache = cache.get_cache()
+    orders_index = order_index.get_order_index()
+    strategy = strategies.get_strategy(os.environ.get('ASSIGN_STRATEGY', 'greedy'))
+
+    api.add_resource(
+        Couriers,
+        '/couriers',
+        '/couriers/<int:courier_id>',
+        resource_class_kwargs={'validator': validator, 'cache': courier_cache, 'order_index': orders_index}
+    )
+    api.add_resource(
+        Orders,
+        '/orders',
+        resource_class_kwargs={'validator': validator, 'order_index': orders_index}
+    )
+    api.add_resource(
+        AssignOrders,
+        '/orders/assign',
+        resource_class_kwargs={'validator': validator, 'strategy': strategy, 'cache': courier_cache,
+                               'order_index': orders_index}
+    )
+    api.add_resource(
+        CompleteOrder,
+        '/orders/complete',
+        resource_class_kwargs={'validator': validator, 'cache': courier_cache}
+    )
+    api.add_resource(
+        CompleteOrders,
+        '/orders/complete/batch',
+        resource_class_kwargs={'validator': validator, 'cache': courier_cache}
+    )
+    api.add_resource(
+        PoolStatus,
+        '/status/pool'
+    )
+    api.add_resource(
+        Metrics,
+        '/metrics'
+    )
+    api.add_resource(
+        OrderIndexStatus,
+        '/status/order-index',
+        resource_class_kwargs={'order_index': orders_index}
+    )
+
+    app.cli.add_command(rebuild_stats)
+    app.cli.add_command(dispatch)
+    app.cli.add_command(archive_orders)
+
+    return app
+
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8080, debug=True)
+    create_app().run(host="0.0.0.0", port=8080, debug=True)
@@ -0,0 +1,95 @@
+"""
+the vectorized matching of the dispatcher accepts the same couriers as util.is_courier_has_time_for_order
+"""
+import random
+import unittest
+
+from app.models import Courier, Order
+from app.services import dispatcher, util
+
+# minutes on the bounds of the day and of each other are checked more often than random ones
+BOUNDARY_MINUTES = [0, 1, 59, 60, 600, 719, 720, 1380, 1438, 1439]
+
+
+def format_minutes(minutes: int) -> str:
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def random_minute(rng: random.Random) -> int:
+    if rng.random() < 0.4:
+        return rng.choice(BOUNDARY_MINUTES)
+    return rng.randrange(24 * 60)
+
+
+def random_hours(rng: random.Random, count: int) -> [str]:
+    """
+    :return: time-ranges, start later than finish means the window crosses midnight
+    """
+    return [f'{format_minutes(random_minute(rng))}-{format_minutes(random_minute(rng))}' for _ in range(count)]
+
+
+def get_couriers_by_region(couriers: [tuple]) -> dict:
+    couriers_by_region = {}
+    for index, courier in enumerate(couriers):
+        for region in courier[2]:
+            couriers_by_region.setdefault(region, []).append(index)
+    return couriers_by_region
+
+
+class DispatcherMatchTestCase(unittest.TestCase):
+    ROUNDS = 50
+    COURIERS = 10
+    ORDERS = 50
+
+    def check_round(self, rng: random.Random, match) -> None:
+        couriers = []
+        for courier_id in range(1, self.COURIERS + 1):
+            working_hours = random_hours(rng, rng.randint(1, 3))
+            couriers.append(Courier(id=courier_id, regions=rng.sample(range(1, 6), rng.randint(1, 3)),
+                                    working_hours=working_hours,
+                                    working_intervals=util.compile_time_ranges(working_hours)))
+        courier_rows = [(courier.id, 50.0, courier.regions, courier.working_intervals) for courier in couriers]
+        couriers_by_region = get_couriers_by_region(courier_rows)
+        orders = []
+        for order_id in range(1, self.ORDERS + 1):
+            delivery_hours = random_hours(rng, rng.randint(1, 3))
+            # orders of regions without couriers are left out by dispatcher.split_by_regions
+            orders.append(Order(id=order_id, weight=1.0, region=rng.choice(list(couriers_by_region)),
+                                delivery_hours=delivery_hours,
+                                delivery_intervals=util.compile_time_ranges(delivery_hours)))
+        order_rows = [(order.id, order.weight, order.region, order.delivery_intervals, None) for order in orders]
+
+        candidates = match(courier_rows, order_rows, couriers_by_region)
+        expected = [[index for index in couriers_by_region[order.region]
+                     if util.is_courier_has_time_for_order(couriers[index], order)]
+                    for order in orders]
+        self.assertEqual(expected, [sorted(indexes) for indexes in candidates],
+                         ([courier.working_hours for courier in couriers], [order.delivery_hours for order in orders]))
+
+    @unittest.skipIf(dispatcher.nm is None, 'numpy is not installed')
+    def test_numpy(self):
+        rng = random.Random(1)
+        for _ in range(self.ROUNDS):
+            self.check_round(rng, dispatcher._match_numpy)
+
+    def test_python(self):
+        rng = random.Random(2)
+        for _ in range(self.ROUNDS):
+            self.check_round(rng, dispatcher._match_python)
+
+    def test_midnight(self):
+        courier = Courier(id=1, regions=[1], working_intervals=util.compile_time_ranges(['22:00-03:00']))
+        hours = [['23:00-01:00'], ['21:59-22:30'], ['02:00-03:01'], ['22:00-22:00']]
+        courier_rows = [(courier.id, 10.0, courier.regions, courier.working_intervals)]
+        order_rows = [(index, 1.0, 1, util.compile_time_ranges(delivery_hours), None)
+                      for index, delivery_hours in enumerate(hours)]
+        matches = [dispatcher._match_python] + ([dispatcher._match_numpy] if dispatcher.nm is not None else [])
+        for match in matches:
+            self.assertEqual([[0], [], [], [0]], match(courier_rows, order_rows, {1: [0]}))
+        self.assertEqual([True, False, False, True],
+                         [util.is_courier_has_time_for_order(courier, Order(delivery_hours=delivery_hours))
+                          for delivery_hours in hours])
+
+
+if __name__ == '__main__':
+    unittest.main()
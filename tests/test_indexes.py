@@ -0,0 +1,115 @@
+"""
+hot queries of assignment read orders by the partial indexes of unassigned orders and of orders in flight.
+The database of POSTGRES_* variables migrated to the head is used, rows of the test are rolled back
+"""
+import datetime
+import json
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import ARRAY, Integer, bindparam, text
+
+from app.models import get_db_url
+from app.services import assignment
+
+# ids of the test are far from ids of real rows
+BASE_ID = 2000000000
+COURIERS = 1000
+ORDERS = 100000
+
+# orders are spread over 100 regions and 24 hours of delivery,
+# every 5th order is unassigned and every 10th is planned, every 49th of the others is in flight,
+# the rest are completed
+FIXTURE_SQL = """
+INSERT INTO couriers (id, courier_type, regions, working_hours, working_intervals, count_delivery)
+SELECT :base_id + g, 'car', '{1,2,3}', '{"09:00-18:00"}', '{540,1080}', 0
+FROM generate_series(0, :couriers - 1) AS g;
+INSERT INTO deliveries (id, courier_id)
+SELECT :base_id + g, :base_id + g % :couriers FROM generate_series(0, :orders / 10) AS g;
+INSERT INTO orders (id, weight, region, delivery_hours, delivery_intervals,
+                    courier_id, start_date, finish_date, delivery_time, delivery_id, planned_courier_id)
+SELECT :base_id + g, (g % 5000) / 100.0 + 0.01, g / 7 % 100,
+       ARRAY[format('%s:00-%s:59', lpad((g % 24)::text, 2, '0'), lpad((g % 24)::text, 2, '0'))],
+       ARRAY[g % 24 * 60, g % 24 * 60 + 59],
+       CASE WHEN g % 5 = 0 THEN NULL ELSE :base_id + g / 10 % :couriers END,
+       CASE WHEN g % 5 = 0 THEN NULL ELSE LOCALTIMESTAMP END,
+       CASE WHEN g % 5 = 0 OR g % 49 = 0 THEN NULL ELSE LOCALTIMESTAMP END,
+       CASE WHEN g % 5 = 0 OR g % 49 = 0 THEN NULL ELSE 1 END,
+       CASE WHEN g % 5 = 0 THEN NULL ELSE :base_id + g / 10 END,
+       CASE WHEN g % 10 = 0 THEN :base_id + g / 10 % :couriers END
+FROM generate_series(1, :orders) AS g;
+ANALYZE orders;
+"""
+
+
+def get_plan_nodes(plan: dict) -> [dict]:
+    """
+    :param plan: node of EXPLAIN (FORMAT JSON)
+    :return: the node and all nodes under it
+    """
+    nodes = [plan]
+    for child in plan.get('Plans', []):
+        nodes += get_plan_nodes(child)
+    return nodes
+
+
+class IndexesTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.engine = sa.create_engine(get_db_url())
+            cls.connection = cls.engine.connect()
+        except (KeyError, sa.exc.OperationalError) as e:
+            raise unittest.SkipTest(f'database is not available: {e}')
+        cls.transaction = cls.connection.begin()
+        cls.connection.execute(text(FIXTURE_SQL), {'base_id': BASE_ID, 'couriers': COURIERS, 'orders': ORDERS})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.transaction.rollback()
+        cls.connection.close()
+        cls.engine.dispose()
+
+    def explain(self, sql: str, params: dict) -> [dict]:
+        """
+        :return: nodes of the plan which read orders
+        """
+        arrays = [bindparam(name, params.pop(name), type_=ARRAY(Integer))
+                  for name in ('regions', 'courier_intervals') if name in params]
+        result = self.connection.execute(text('EXPLAIN (FORMAT JSON) ' + sql).bindparams(*arrays), params).scalar()
+        if isinstance(result, str):
+            result = json.loads(result)
+        return [node for node in get_plan_nodes(result[0]['Plan'])
+                if node.get('Relation Name', node.get('Index Name', '')).startswith(('orders', 'ix_orders'))]
+
+    def assert_index(self, nodes: [dict], prefix: str) -> None:
+        self.assertTrue(nodes)
+        self.assertNotIn('Seq Scan', [node['Node Type'] for node in nodes])
+        self.assertTrue(any(node.get('Index Name', '').startswith(prefix) for node in nodes),
+                        [(node['Node Type'], node.get('Index Name')) for node in nodes])
+
+    def test_candidates(self):
+        nodes = self.explain(assignment.CANDIDATES_SQL, {'regions': [1, 2, 3], 'weight': 50.0,
+                                                         'courier_intervals': [540, 1080]})
+        self.assert_index(nodes, 'ix_orders_unassigned_')
+
+    def test_planned_candidates(self):
+        nodes = self.explain(assignment.PLANNED_CANDIDATES_SQL, {'regions': [1, 2, 3], 'weight': 50.0,
+                                                                 'courier_intervals': [540, 1080],
+                                                                 'courier_id': BASE_ID})
+        self.assert_index(nodes, 'ix_orders_unassigned_planned_courier')
+
+    def test_courier_load(self):
+        nodes = self.explain(assignment.COURIER_LOAD_SQL, {'courier_id': BASE_ID})
+        self.assert_index(nodes, 'ix_orders_courier_in_flight')
+
+    def test_release(self):
+        nodes = self.explain(assignment.RELEASE_SQL, {'courier_id': BASE_ID, 'capacity': 10, 'regions': [1],
+                                                      'courier_intervals': [540, 600],
+                                                      'now': datetime.datetime.now()})
+        self.assert_index(nodes, 'ix_orders_courier_in_flight')
+
+
+if __name__ == '__main__':
+    unittest.main()